@@ -1,16 +1,24 @@
 import argparse
+import json
+import os
+import time
 from collections import Counter
 from copy import deepcopy
+from functools import partial
 
 import numpy as np
 import yaml
+from keras import backend as K
 from keras.callbacks import EarlyStopping, ModelCheckpoint
-from keras.preprocessing.sequence import pad_sequences
 from keras.utils import np_utils
 from sklearn.preprocessing import LabelEncoder
 
-from src import extract_word_root_and_feature, cnn_rnn_with_context, evaluate_and_plot
-from src import handle_pickles, process_words, extract_phonetic_features
+from src import extract_word_root_and_feature, cnn_rnn_with_context, evaluate_and_plot, compiled_inference
+from src import layer_profiler
+from src import hyperparameter_sweep, model_registry, pruning, data_parallel, continued_training, graph_export
+from src import inference_tuner
+from src import handle_pickles, process_words, extract_phonetic_features, tensor_store, decode_outputs, deduplicate
+from src import normalize_text
 
 
 def str2bool(v):
@@ -21,12 +29,46 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
+
+def str2outputs(v):
+    output_names = {name.lower(): name for name in cnn_rnn_with_context.OUTPUT_NAMES}
+    outputs = [each.strip().lower() for each in v.split(',') if len(each.strip()) > 0]
+    if len(outputs) == 0 or any(each not in output_names for each in outputs):
+        raise argparse.ArgumentTypeError('Outputs must be a comma separated subset of: ' +
+                                         ','.join(cnn_rnn_with_context.OUTPUT_NAMES))
+    return sorted(set(output_names[each] for each in outputs), key=cnn_rnn_with_context.OUTPUT_NAMES.index)
+
+
+def str2variants(v):
+    try:
+        return [model_registry.parse_variant(each) for each in v.split(',') if len(each.strip()) > 0]
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+MODES = ['train', 'test', 'predict', 'sweep', 'stats', 'build_vocab', 'compare', 'profile', 'prune', 'parallel_train',
+         'scaling', 'continue', 'export', 'tune', 'tokenize_benchmark']
+
 parser = argparse.ArgumentParser(description="Enter --lang = 'hindi' for Hindi and 'urdu' for Urdu; "
-                                    "--mode = 'train, test, or predict'")
+                                    "--mode = '" + ', '.join(MODES[:-1]) + " or " + MODES[-1] + "'")
 parser.add_argument("--lang", required=True)
-parser.add_argument("--mode", required=True, default='test')
+parser.add_argument("--mode", required=True, default='test', choices=MODES)
 parser.add_argument("--phonetic", type=str2bool, nargs='?')
 parser.add_argument('--freezing', type=str2bool, nargs='?')
+parser.add_argument('--backend', choices=['keras', 'xla', 'frozen'], default='keras')
+parser.add_argument('--compare', type=str2bool, nargs='?')
+parser.add_argument('--store', type=str2bool, nargs='?')
+parser.add_argument('--workers', type=int, default=None)
+parser.add_argument('--approximate', type=str2bool, nargs='?')
+parser.add_argument('--output_format', choices=decode_outputs.OUTPUT_FORMATS, default='tsv')
+parser.add_argument('--outputs', type=str2outputs, default=cnn_rnn_with_context.OUTPUT_NAMES)
+parser.add_argument('--variants', type=str2variants, default=None)
+parser.add_argument('--in_graph_phonetic', type=str2bool, nargs='?')
+parser.add_argument('--max_word_len', type=int, default=20)
+parser.add_argument('--batch_size', type=int, default=None)
+parser.add_argument('--weights', type=str, default=None)
+parser.add_argument('--new_data', type=str, default=None)
+parser.add_argument('--label_policy', choices=continued_training.LABEL_POLICIES, default=None)
+parser.add_argument('--dedup', type=str2bool, nargs='?')
 
 args = vars(parser.parse_args())
 pickle_handler= handle_pickles.PickleHandler()
@@ -34,12 +76,33 @@ pickle_handler= handle_pickles.PickleHandler()
 LANG, MODE = args['lang'], args['mode']
 PHONETIC_FLAG = args['phonetic'] if args['phonetic'] is not None else False
 FREEZER_FLAG = args['freezing'] if args['freezing'] is not None else False
+BACKEND = args['backend']
+COMPARE_FLAG = args['compare'] if args['compare'] is not None else False
+STORE_FLAG = args['store'] if args['store'] is not None else False
+NUM_WORKERS = args['workers'] or os.cpu_count()
+APPROXIMATE_FLAG = args['approximate'] if args['approximate'] is not None else False
+OUTPUT_FORMAT = args['output_format']
+REQUESTED_OUTPUTS = args['outputs']
+IN_GRAPH_PHONETIC_FLAG = PHONETIC_FLAG and args['in_graph_phonetic'] is True
+MAX_WORD_LEN = args['max_word_len']
+BATCH_SIZE = args['batch_size']
+WEIGHTS_PATH = args['weights']
+NEW_DATA_PATH = args['new_data']
+LABEL_POLICY = args['label_policy']
+DEDUP_FLAG = args['dedup'] if args['dedup'] is not None else False
+VARIANTS = args['variants'] or \
+    [model_registry.Variant(LANG, phonetic, freezing) for phonetic in [False, True] for freezing in [False, True]]
+# the workers train every layer in a single phase, so they cannot produce the two-phase frozen variant
+if MODE == 'parallel_train' and FREEZER_FLAG is True:
+    parser.error("--freezing is not supported by the parallel_train mode; use the train mode for frozen variants")
 
 CONFIG_PATH = 'config/'
 
 VOCAB_SIZE = 89
 CONTEXT_WINDOW = 4
 FEATURE_NUMS = 6
+VOCAB_RESOURCES = model_registry.VOCAB_RESOURCES
+EXPORT_RESOURCES = VOCAB_RESOURCES + ['class_labels_orig', 'class_labels_transformed']
 
 def read_path_configs(filename):
     with open(CONFIG_PATH + filename, 'r') as stream:
@@ -52,9 +115,10 @@ def read_path_configs(filename):
 
 
 class ProcessAndTokenizeData():
-    def __init__(self, n_features, words, roots, features):
+    def __init__(self, n_features, words, roots, features, encoders=None):
         self.n_features = n_features
         self.all_words, self.all_roots, self.all_segregated_features = words, roots, features
+        self.encoders = encoders # (dict_of_encoders, num_of_indiv_feature_tags) to use instead of the saved ones
 
     @staticmethod
     def get_counters_for_features(all_features, flag='original'):
@@ -87,9 +151,9 @@ class ProcessAndTokenizeData():
                                                        "categorized_features", 'class_labels_orig',
                                                        'class_labels_transformed'])]
             return categorical_features, num_of_indiv_feature_tags
-        elif MODE == 'test':
-            dict_of_encoders, num_of_indiv_feature_tags = [pickle_handler.pickle_loader(name+'_'+LANG) for name in
-                                                           ["dict_of_encoders", "num_of_indiv_features"]]
+        else:
+            dict_of_encoders, num_of_indiv_feature_tags = self.encoders or \
+                [pickle_handler.pickle_loader(name+'_'+LANG) for name in ["dict_of_encoders", "num_of_indiv_features"]]
             encoded_features_test = [dict_of_encoders[i].transform(self.all_segregated_features[i]) \
                                 for i in range(self.n_features)]
             categorical_features_test = [np_utils.to_categorical(feature, num_classes=n) for feature, n in
@@ -105,6 +169,7 @@ class ProcessAndTokenizeData():
         else:
             X_indexed = process_words.get_indexed_words(X, mode='use_vocab', vocab_size=VOCAB_SIZE, lang=LANG)
         y_indexed = process_words.get_indexed_words(y, mode='use_vocab', vocab_size=VOCAB_SIZE, lang=LANG)
+        report_dropped_phonetic_features(self.all_words)
         input_shifter = process_words.ShiftWordsPerCW(X=X, cw=context_window, vocab_size=VOCAB_SIZE, lang=LANG)
         X_indexed_left, X_indexed_right = input_shifter.shift_input()
         all_inputs = list()
@@ -115,39 +180,81 @@ class ProcessAndTokenizeData():
         return all_inputs
 
 
-def sequence_padder(in_list, maxlen):
-    out_list = pad_sequences(in_list, maxlen=maxlen, dtype='int32', padding='post')
-    return out_list
-
+def get_model_kwargs(max_word_len, embed_dim, n, phonetic_feature_nums, architecture=None):
+    model_kwargs = dict(max_word_len=max_word_len, vocab_len=VOCAB_SIZE+2, embedding_dim=embed_dim,
+                        list_of_feature_nums=n, cw=CONTEXT_WINDOW, use_phonetic_features=PHONETIC_FLAG,
+                        phonetic_dims=phonetic_feature_nums, phonetic_tables=get_phonetic_tables())
+    model_kwargs.update(architecture or dict())
+    return model_kwargs
 
-def pad_all_sequences(indexed_outputs):
-    max_word_len = max(max([len(word) for word in indexed_outputs[0]]), max([len(word) for word in indexed_outputs[-1]]))
-    all_padded_inputs = [sequence_padder(each, max_word_len) for each in indexed_outputs]
-    return all_padded_inputs, max_word_len
 
-
-def _create_model(max_word_len, embed_dim, n, phonetic_feature_nums, freezing_call=False):
-    model_instance = cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=max_word_len, vocab_len=VOCAB_SIZE+2,
-                                                              embedding_dim=embed_dim, list_of_feature_nums=n,
-                                                              cw=CONTEXT_WINDOW, use_phonetic_features=PHONETIC_FLAG,
-                                                              phonetic_dims=phonetic_feature_nums)
+def _create_model(max_word_len, embed_dim, n, phonetic_feature_nums, freezing_call=False, architecture=None):
+    model_instance = cnn_rnn_with_context.MorphAnalyzerModels(**get_model_kwargs(max_word_len, embed_dim, n,
+                                                                                 phonetic_feature_nums, architecture))
     compiled_model = model_instance.create_and_compile_model(freezer=freezing_call)
     return compiled_model
 
 
+def get_phonetic_tables():
+    if IN_GRAPH_PHONETIC_FLAG is False:
+        return None
+    idx_to_char_mapping = pickle_handler.pickle_loader('index_to_char_mapping'+'_'+LANG)
+    return extract_phonetic_features.get_char_feature_tables(idx_to_char_mapping, vocab_len=VOCAB_SIZE+2)[:FEATURE_NUMS]
+
+
+def report_dropped_phonetic_features(words):
+    # chars outside the vocab are indexed as 'U', so the in-graph lookup loses the phonetic features they carry
+    if IN_GRAPH_PHONETIC_FLAG is False:
+        return
+    dropped = extract_phonetic_features.count_dropped_feature_chars(words, process_words.load_vocab(lang=LANG))
+    if len(dropped) > 0:
+        print(f"In-graph phonetic features drop {sum(dropped.values())} OOV chars with features "
+              f"({len(dropped)} distinct, most common: {dropped.most_common(5)})")
+
+
+def get_prediction_sentences(data_dir, workers=NUM_WORKERS):
+    # tokens are spelled the way the trained vocab spells them (NFC unless that makes characters unknown)
+    tokenizer_params = read_path_configs('model_params.yaml')['TOKENIZER']
+    vocab = frozenset(pickle_handler.pickle_loader('index_to_char_mapping'+'_'+LANG))
+    return extract_word_root_and_feature.get_words_for_predictions(data_dir, vocab=vocab, workers=workers,
+                                                                   min_pool_lines=tokenizer_params['POOL_MIN_LINES'])
+
+
+def get_inference_profile_dir(paths):
+    return paths.get('inference_profiles', 'inference_profiles/')
+
+
+def read_inference_profile(paths, backend=BACKEND):
+    # settings tuned for this host and this model by the tune mode, if any
+    return inference_tuner.read_profile(get_inference_profile_dir(paths), get_export_name(), backend)
+
+
+def _create_predictor(paths, embed_dim, n, phonetic_feature_nums, batch_size, backend=BACKEND, settings=None):
+    # settings tuned for this host by the tune mode, if any, override the defaults
+    settings = settings if settings is not None else read_inference_profile(paths, backend)
+    batch_size = settings.get('BATCH_SIZE', batch_size)
+    predictor_kwargs = dict(batch_size=batch_size, intra_op_threads=settings.get('INTRA_OP_THREADS', 0),
+                            inter_op_threads=settings.get('INTER_OP_THREADS', 0))
+    def model_builder(max_word_len):
+        model = _create_model(max_word_len, embed_dim, n, phonetic_feature_nums,
+                              architecture=pruning.read_architecture(get_model_path(paths=paths)))
+        model.load_weights(get_model_path(paths=paths))
+        return model
+    if backend == 'frozen':
+        predictor = graph_export.FrozenGraphPredictor(get_export_dir(paths), **predictor_kwargs)
+    elif backend == 'xla':
+        predictor = compiled_inference.CompiledPredictor(model_builder, **predictor_kwargs)
+    else:
+        predictor = compiled_inference.KerasPredictor(model_builder, **predictor_kwargs)
+    return predictor
+
+
 def split_train_val(all_data, train_size):
     train_data = [x[:train_size] for x in all_data]
     val_data = [x[train_size:] for x in all_data]
     return train_data, val_data
 
 
-def get_decoder_input(x_train):
-    x_decoder_input = np.zeros_like(x_train)
-    x_decoder_input[:, 1:] = x_train[:, :-1]
-    x_decoder_input[:, 0] = 1
-    return x_decoder_input
-
-
 def segregate_inputs_and_outputs(words_and_roots, features, decoder_inputs, phonetic_features=None):
     roots = words_and_roots[-1]
     inputs = words_and_roots[:-1]
@@ -155,9 +262,9 @@ def segregate_inputs_and_outputs(words_and_roots, features, decoder_inputs, phon
     num_of_optimized_features = list()
 
     if PHONETIC_FLAG is True:
-        tag_grouped_phonetic_features = [list(zip(*phonetic_features))[idx] for idx in range(len(phonetic_features[0]))]
-        _ = [inputs.append(np.array(each)) for each in tag_grouped_phonetic_features]
-        num_of_optimized_features = [len(each) for each in phonetic_features[0]]
+        num_of_optimized_features = extract_phonetic_features.get_phonetic_feature_nums()[:FEATURE_NUMS]
+        if IN_GRAPH_PHONETIC_FLAG is False: # otherwise the model computes them from the current word
+            inputs += extract_phonetic_features.group_features_by_tag(phonetic_features)
 
     outputs = [roots]
     outputs += features
@@ -166,69 +273,61 @@ def segregate_inputs_and_outputs(words_and_roots, features, decoder_inputs, phon
 
 def write_features_to_file(words, orig_features, pred_features, output_path):
     encoders = pickle_handler.pickle_loader('dict_of_encoders'+'_'+LANG)
-    orig_features = [[np.where(idx==1)[0][0] for idx in each] for each in orig_features]
-    pred_features = [each.tolist() for each in pred_features]
-    orig_transformed_features = [encoders[i].inverse_transform(orig_features[i]) for i in range(FEATURE_NUMS)]
-    pred_transformed_features = [encoders[i].inverse_transform(pred_features[i]) for i in range(FEATURE_NUMS)]
+    orig_transformed_features = decode_outputs.decode_features([np.argmax(each, axis=1) for each in orig_features],
+                                                               encoders)
+    pred_transformed_features = decode_outputs.decode_features(pred_features, encoders)
     for idx in range(FEATURE_NUMS):
-        filename = output_path+'feature_'+str(idx)+'.txt'
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("Word\t\tOriginal_feature\t\tPredicted_feature\n")
-            for i,j,k in zip(words, orig_transformed_features[idx], pred_transformed_features[idx]):
-                f.write(i + '\t\t' + str(j) + '\t\t' + str(k) + '\n')
-            f.close()
+        decode_outputs.write_table(output_path+'feature_'+str(idx), [('Word', words),
+                                                                     ('Original_feature', orig_transformed_features[idx]),
+                                                                     ('Predicted_feature', pred_transformed_features[idx])],
+                                   output_format=OUTPUT_FORMAT)
 
 
 def write_roots_to_file(words, orig_roots, pred_roots, output_path):
     idx_to_char_mapping = pickle_handler.pickle_loader('index_to_char_mapping'+'_'+LANG)
-    pred_sequences = list()
-    for each in pred_roots:
-        list_of_chars = list()
-        list_of_chars += [idx_to_char_mapping[idx] for idx in each if idx > 0]
-        sequence = ''.join(list_of_chars)
-        pred_sequences.append(sequence)
-    out_file = output_path+'_words.txt'
-    with open(out_file, 'w', encoding='utf-8') as f:
-        f.write("Word\t\tOriginal_root\t\tPredicted_root\n")
-        for i,j,k in zip(words, orig_roots, pred_sequences):
-            f.write(i + '\t\t' + j + '\t\t' + str(k) + '\n')
-        f.close()
+    pred_sequences = decode_outputs.decode_roots(pred_roots, idx_to_char_mapping).tolist()
+    decode_outputs.write_table(output_path+'_words', [('Word', words), ('Original_root', orig_roots),
+                                                      ('Predicted_root', pred_sequences)], output_format=OUTPUT_FORMAT)
     return orig_roots, pred_sequences
 
 
 def write_predicted_roots_and_features(sentences, predictions, output_path):
     encoders = pickle_handler.pickle_loader('dict_of_encoders'+'_'+LANG)
     idx_to_char_mapping = pickle_handler.pickle_loader('index_to_char_mapping'+'_'+LANG)
-    with open(output_path + 'predictions.txt', 'w', encoding='utf-8') as f:
-        f.write("Word\t\tRoot\t\tPOS\t\tGender\t\tNumber\t\tPerson\t\tCase\t\tTAM\n")
-        for sentence, prediction in zip(sentences, predictions):
-            pred_features = [each.tolist() for each in predictions[1:]]
-            pred_transformed_features = [encoders[i].inverse_transform(pred_features[i]) for i in range(FEATURE_NUMS)]
-            pred_sequences = list()
-            for word in prediction:
-                list_of_chars = list()
-                list_of_chars += [idx_to_char_mapping[idx] for idx in word if idx > 0]
-                sequence = ''.join(list_of_chars)
-                pred_sequences.append(sequence)
-            all_outputs = list()
-            all_outputs.append(sentence)
-            all_outputs.append(pred_sequences)
-            all_outputs += pred_transformed_features
-            for each in zip(*all_outputs):
-                f.write('\t\t'.join(each) + '\n')
-            f.write('\n')
-        f.close()
+    columns = [('Word', [word for sentence in sentences for word in sentence])]
+    for name in [each for each in cnn_rnn_with_context.OUTPUT_NAMES if each in predictions[0]]:
+        if name == 'root':
+            values = decode_outputs.decode_roots(decode_outputs.pad_and_stack([each[name] for each in predictions]),
+                                                 idx_to_char_mapping)
+        else:
+            values = decode_outputs.decode_feature(np.concatenate([each[name] for each in predictions]),
+                                                   encoders[cnn_rnn_with_context.OUTPUT_NAMES.index(name) - 1])
+        columns.append((name[0].upper() + name[1:], values))
+    decode_outputs.write_table(output_path+'predictions', columns, output_format=OUTPUT_FORMAT,
+                               sentence_lengths=[len(sentence) for sentence in sentences])
 
 def get_model_path(paths):
-    if PHONETIC_FLAG is True and FREEZER_FLAG is True:
-        key = 4
-    elif PHONETIC_FLAG is False and FREEZER_FLAG is True:
-        key = 3
-    elif PHONETIC_FLAG is True and FREEZER_FLAG is False:
-        key = 2
-    else:
-        key = 1
-    return paths['model_weights'][key]+'_'+LANG+'.hdf5'
+    if WEIGHTS_PATH is not None:
+        return WEIGHTS_PATH
+    return model_registry.get_weights_path(paths, LANG, phonetic=PHONETIC_FLAG, freezing=FREEZER_FLAG)
+
+
+def get_export_name(variant=None):
+    return model_registry.get_export_name(variant or model_registry.Variant(LANG, PHONETIC_FLAG, FREEZER_FLAG),
+                                          IN_GRAPH_PHONETIC_FLAG)
+
+
+def get_export_dir(paths, variant=None):
+    return paths.get('export_dir', 'exports/') + get_export_name(variant)
+
+
+def use_export_resources(paths):
+    """Reads the vocab, encoders and labels bundled with the frozen export, so they always match its graphs."""
+    export_dir = get_export_dir(paths)
+    manifest = graph_export.read_manifest(export_dir)
+    graph_export.check_vocab_version(manifest, pickle_handler.get_version([name+'_'+LANG for name in VOCAB_RESOURCES]))
+    graph_export.check_weights_version(manifest, graph_export.get_weights_version(get_model_path(paths=paths)))
+    handle_pickles.RESOURCE_DIR = graph_export.get_resource_dir(export_dir)
 
 
 def get_frozen_layer_names():
@@ -254,9 +353,9 @@ def get_frozen_layer_names():
 
 
 class RemoveErroneousIndices():
-    def __init__(self, test_file_contents):
+    def __init__(self, test_file_contents, lang=LANG):
         self.contents = test_file_contents
-        self.class_labels = pickle_handler.pickle_loader('class_labels_orig_'+LANG)
+        self.class_labels = pickle_handler.pickle_loader('class_labels_orig_'+lang)
         self.erroneous_indices = self.get_erroneous_indices()
 
     def filter_erroneous_indices(self, _list):
@@ -282,10 +381,11 @@ class RemoveErroneousIndices():
 
 
 class ProcessDataForModel():
-    def __init__(self, words, roots, features):
+    def __init__(self, words, roots, features, encoders=None):
         self.words = words
         self.roots = roots
         self.features = features
+        self.encoders = encoders
 
     def phonetic_features_extractor(self):
         extractor = extract_phonetic_features.PhoneticFeatures(self.words)
@@ -293,19 +393,19 @@ class ProcessDataForModel():
         features = [word_feature[:FEATURE_NUMS] for word_feature in features]
         return features
 
-    def process_end_to_end(self):
+    def process_end_to_end(self, context_window=CONTEXT_WINDOW):
         data_processor = ProcessAndTokenizeData(n_features=FEATURE_NUMS, words=self.words,
                                                 roots=self.roots,
-                                                features = self.features)
+                                                features = self.features, encoders=self.encoders)
         categorized_features, n = data_processor.process_features()
-        indexed_inputs = data_processor.process_words_and_roots(CONTEXT_WINDOW)
-        padded_indexed_inputs, max_word_len = pad_all_sequences(indexed_inputs)
+        indexed_inputs = data_processor.process_words_and_roots(context_window)
+        padded_indexed_inputs, max_word_len = process_words.pad_all_sequences(indexed_inputs)
         padded_indexed_inputs[-1] = process_words.one_hot_encode_output_data(
             padded_indexed_inputs[-1], max_word_len, VOCAB_SIZE+2
         )
-        decoder_input = get_decoder_input(padded_indexed_inputs[0])
+        decoder_input = process_words.get_decoder_input(padded_indexed_inputs[0])
         phonetic_features = list()
-        if PHONETIC_FLAG is True:
+        if PHONETIC_FLAG is True and IN_GRAPH_PHONETIC_FLAG is False:
             phonetic_features = self.phonetic_features_extractor()
         all_inputs, all_outputs, num_of_optimized_features = segregate_inputs_and_outputs(padded_indexed_inputs,
                                                                                           categorized_features,
@@ -314,42 +414,106 @@ class ProcessDataForModel():
 
         return [all_inputs, all_outputs, max_word_len, n, num_of_optimized_features]
 
-def main():
-    paths = read_path_configs('data_paths.yaml')
-    if MODE == 'train':
-        train_data_dir = paths[LANG][MODE]
-        train_words, train_roots, train_features = \
-            extract_word_root_and_feature.get_words_roots_and_features(train_data_dir, n_features=FEATURE_NUMS,
-                                                                       lang=LANG, get_stats=False)
-        val_data_dir = paths[LANG]['validation']
-        val_words, val_roots, val_features = \
-            extract_word_root_and_feature.get_words_roots_and_features(val_data_dir, n_features=FEATURE_NUMS,
-                                                                       lang=LANG, get_stats=False)
-        assert len(train_words) == len(train_roots) == len(train_features[1]), \
-            "Length mismatch while flattening train features"
-        assert len(val_words) == len(val_roots) == len(val_features[1]),\
-            "Length mismatch while flattening val features"
-        # print(len(train_words), len(train_roots), len(train_features[0]))
-        # print("words: {}, roots: {}, features: {}".format(train_words[:5], train_roots[:5], train_features[:5]))
-        train_size, val_size = [len(each) for each in [train_words, val_words]]
-        train_val_words, train_val_roots = [train_words + val_words, train_roots + val_roots]
-        train_val_features = [i+j for i,j in zip(train_features, val_features)]
+def _read_train_and_val_data(paths):
+    train_data_dir = paths[LANG]['train']
+    train_words, train_roots, train_features = \
+        extract_word_root_and_feature.get_words_roots_and_features(train_data_dir, n_features=FEATURE_NUMS,
+                                                                   lang=LANG, get_stats=False)
+    val_data_dir = paths[LANG]['validation']
+    val_words, val_roots, val_features = \
+        extract_word_root_and_feature.get_words_roots_and_features(val_data_dir, n_features=FEATURE_NUMS,
+                                                                   lang=LANG, get_stats=False)
+    assert len(train_words) == len(train_roots) == len(train_features[1]), \
+        "Length mismatch while flattening train features"
+    assert len(val_words) == len(val_roots) == len(val_features[1]),\
+        "Length mismatch while flattening val features"
+    # print(len(train_words), len(train_roots), len(train_features[0]))
+    # print("words: {}, roots: {}, features: {}".format(train_words[:5], train_roots[:5], train_features[:5]))
+    train_size, val_size = [len(each) for each in [train_words, val_words]]
+    train_val_words, train_val_roots = [train_words + val_words, train_roots + val_roots]
+    train_val_features = [i+j for i,j in zip(train_features, val_features)]
+    return train_val_words, train_val_roots, train_val_features, train_size
+
+
+def get_tensor_store(paths, split):
+    store_name = '_'.join([LANG, split, 'phonetic' if PHONETIC_FLAG else 'plain'])
+    if IN_GRAPH_PHONETIC_FLAG is True:
+        store_name += '_in_graph'
+    return tensor_store.TensorStore(paths.get('tensor_store', 'tensor_store/') + store_name)
+
+
+def get_store_manifest(data_dirs):
+    return {'lang': LANG, 'context_window': CONTEXT_WINDOW, 'phonetic': PHONETIC_FLAG,
+            'in_graph_phonetic': IN_GRAPH_PHONETIC_FLAG,
+            'vocab_version': pickle_handler.get_version([name+'_'+LANG for name in VOCAB_RESOURCES]),
+            'data_version': tensor_store.get_data_fingerprint(data_dirs)}
+
+
+def write_tensor_store(store, data_dirs, all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, texts=None,
+                       **extra):
+    manifest = get_store_manifest(data_dirs)
+    manifest.update({'max_word_len': int(max_word_len), 'n': [int(each) for each in n],
+                     'phonetic_dims': phonetic_feature_num}, **extra)
+    store.write(all_inputs, all_outputs, manifest, texts=texts)
+
+
+def _load_train_and_val_inputs(paths, use_store=STORE_FLAG):
+    data_dirs = [paths[LANG]['train'], paths[LANG]['validation']]
+    store = get_tensor_store(paths, 'train')
+    if use_store is True and store.is_compatible(**get_store_manifest(data_dirs)):
+        all_inputs, all_outputs, manifest = store.read()
+        max_word_len, n, phonetic_feature_num, train_size = [manifest[key] for key in ['max_word_len', 'n',
+                                                                                         'phonetic_dims',
+                                                                                         'train_size']]
+    else:
+        train_val_words, train_val_roots, train_val_features, train_size = _read_train_and_val_data(paths)
         train_data_generator = ProcessDataForModel(words=train_val_words, roots=train_val_roots,
                                                    features=train_val_features)
 
-        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num = train_data_generator.process_end_to_end()
+        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num = \
+            train_data_generator.process_end_to_end()
+        if use_store is True:
+            write_tensor_store(store, data_dirs, all_inputs, all_outputs, max_word_len, n, phonetic_feature_num,
+                               train_size=train_size)
+    return all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, train_size
+
+
+def main():
+    paths = read_path_configs('data_paths.yaml')
+    if BACKEND == 'frozen' and MODE in ['test', 'predict', 'tune']:
+        use_export_resources(paths)
+    if MODE == 'train':
+        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, train_size = \
+            _load_train_and_val_inputs(paths)
         params = read_path_configs('model_params.yaml')
         model = _create_model(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num)
 
         train_inputs, val_inputs = split_train_val(all_inputs, train_size)
         train_outputs, val_outputs = split_train_val(all_outputs, train_size)
+        sample_weight, epoch_timer = None, deduplicate.EpochTimer()
+        if DEDUP_FLAG is True:
+            full_data = (train_inputs, train_outputs)
+            train_inputs, train_outputs, weights, dedup_stats = deduplicate.deduplicate(train_inputs, train_outputs)
+            sample_weight = [weights] * len(train_outputs)
+            print(f"Deduplicated {dedup_stats['examples']} training examples to {dedup_stats['unique_examples']} "
+                  f"(ratio {dedup_stats['dedup_ratio']:.3f}, most repeated x{dedup_stats['max_count']})")
+            # timed on a copy of the model, so training starts from the same weights and optimizer state
+            epoch_times = deduplicate.time_epochs(model, full_data, (train_inputs, train_outputs, sample_weight),
+                                                  params['BATCH_SIZE'])
+            full_data = None
+            print(f"Epoch time {epoch_times['dedup_epoch_seconds']:.1f}s against "
+                  f"{epoch_times['full_epoch_seconds']:.1f}s without deduplication, timed on the same number of "
+                  f"batches ({epoch_times['epoch_time_reduction']:.1%} shorter)")
         hist = model.fit(train_inputs, train_outputs, validation_data=(val_inputs, val_outputs),
-                         batch_size = params['BATCH_SIZE'], epochs=params['EPOCHS'],
+                         batch_size = params['BATCH_SIZE'], epochs=params['EPOCHS'], sample_weight=sample_weight,
                          callbacks=[EarlyStopping(patience=10),
                                     ModelCheckpoint(filepath= get_model_path(paths=paths),
                                                     save_best_only=True,
-                                                    verbose=1, save_weights_only=True)
+                                                    verbose=1, save_weights_only=True),
+                                    epoch_timer
                                     ])
+        if DEDUP_FLAG is True:
+            print(f"Median epoch time on the deduplicated data: {np.median(epoch_timer.epoch_seconds):.1f}s")
         if FREEZER_FLAG is True:
             frozen_model = _create_model(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num, freezing_call=True)
             model.load_weights(get_model_path(paths=paths))
@@ -363,7 +527,7 @@ def main():
                     pass
             frozen_model.compile(optimizer='adadelta', loss='categorical_crossentropy', metrics=['accuracy'])
             hist = frozen_model.fit(train_inputs, train_outputs, validation_data=(val_inputs, val_outputs),
-                             batch_size=params['BATCH_SIZE'], epochs=params['EPOCHS'],
+                             batch_size=params['BATCH_SIZE'], epochs=params['EPOCHS'], sample_weight=sample_weight,
                              callbacks=[EarlyStopping(patience=10),
                                         ModelCheckpoint(filepath=get_model_path(paths=paths),
                                                         save_best_only=True,
@@ -371,18 +535,42 @@ def main():
                                         ])
     elif MODE == 'test':
         test_data_dir = paths[LANG][MODE]
-        contents = extract_word_root_and_feature.get_words_roots_and_features(test_data_dir, n_features=FEATURE_NUMS,
-                                                                              lang=LANG, get_stats=False)
-        index_identifier = RemoveErroneousIndices(contents)
-        test_words, test_roots, test_features = index_identifier.remove_unknown_feature_labels()
-        test_data_generator = ProcessDataForModel(words=test_words, roots=test_roots,
-                                                   features=test_features)
-
-        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num = test_data_generator.process_end_to_end()
+        store = get_tensor_store(paths, 'test')
+        # the store keeps the words and roots the outputs are written with, so a hit skips parsing the corpus
+        if STORE_FLAG is True and store.is_compatible(**get_store_manifest([test_data_dir]), texts=['roots', 'words']):
+            all_inputs, all_outputs, manifest = store.read()
+            max_word_len, n, phonetic_feature_num = [manifest[key] for key in ['max_word_len', 'n', 'phonetic_dims']]
+            test_words, test_roots = [store.read_texts()[key] for key in ['words', 'roots']]
+        else:
+            contents = extract_word_root_and_feature.get_words_roots_and_features(test_data_dir,
+                                                                                  n_features=FEATURE_NUMS, lang=LANG,
+                                                                                  get_stats=False)
+            index_identifier = RemoveErroneousIndices(contents)
+            test_words, test_roots, test_features = index_identifier.remove_unknown_feature_labels()
+            test_data_generator = ProcessDataForModel(words=test_words, roots=test_roots,
+                                                       features=test_features)
+
+            all_inputs, all_outputs, max_word_len, n, phonetic_feature_num = test_data_generator.process_end_to_end()
+            if STORE_FLAG is True:
+                write_tensor_store(store, [test_data_dir], all_inputs, all_outputs, max_word_len, n,
+                                   phonetic_feature_num, texts={'words': test_words, 'roots': test_roots})
         params = read_path_configs('model_params.yaml')
-        model = _create_model(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num)
-        model.load_weights(get_model_path(paths=paths))
-        pred_outputs = model.predict(all_inputs)
+        if BACKEND in ['xla', 'frozen']:
+            predictor = _create_predictor(paths, params['EMBED_DIM'], n, phonetic_feature_num, params['BATCH_SIZE'])
+            if BACKEND == 'xla':
+                predictor.warm_up([max_word_len])
+            pred_outputs = predictor.predict(all_inputs)
+        if BACKEND == 'keras' or COMPARE_FLAG is True:
+            settings = read_inference_profile(paths, 'keras')
+            if settings:
+                compiled_inference.set_default_session(settings['INTRA_OP_THREADS'], settings['INTER_OP_THREADS'])
+            model = _create_model(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num,
+                                  architecture=pruning.read_architecture(get_model_path(paths=paths)))
+            model.load_weights(get_model_path(paths=paths))
+            if BACKEND == 'keras':
+                pred_outputs = model.predict(all_inputs, batch_size=settings.get('BATCH_SIZE', params['BATCH_SIZE']))
+            else:
+                _ = compiled_inference.compare_with_keras_predict(model, predictor, all_inputs, backend_name=BACKEND)
 
         predicted_char_indices = np.argmax(pred_outputs[0], axis=2)
         predicted_features = [np.argmax(each, axis=1) for each in pred_outputs[1:]]
@@ -395,47 +583,369 @@ def main():
 
     elif MODE == 'predict':
         test_data_dir = paths[LANG+'_'+MODE+'_input']
-        sentences = extract_word_root_and_feature.get_words_for_predictions(test_data_dir)
+        sentences = get_prediction_sentences(test_data_dir)
+        report_dropped_phonetic_features([word for sentence in sentences for word in sentence])
+        params = read_path_configs('model_params.yaml')
+        n = pickle_handler.pickle_loader('num_of_indiv_features'+'_'+LANG)
+        num_of_optimized_features = list()
+        if PHONETIC_FLAG is True:
+            num_of_optimized_features = extract_phonetic_features.get_phonetic_feature_nums()
+        predictor = _create_predictor(paths, params['EMBED_DIM'], n, num_of_optimized_features, params['BATCH_SIZE'])
+        # builds (and for xla compiles) a model for every word length in the input before the first sentence
+        predictor.warm_up(set(max(len(word) for word in sentence) for sentence in sentences if len(sentence) > 0),
+                          outputs=REQUESTED_OUTPUTS)
         predictions = list()
+        feature_outputs = [output for output in REQUESTED_OUTPUTS if output != 'root']
         for sentence in sentences:
             words_reversed = [item[::-1] for item in sentence]
             X_indexed = process_words.get_indexed_words(words_reversed, mode='use_vocab', vocab_size=VOCAB_SIZE,
                                                         lang=LANG)
-            input_shifter = process_words.ShiftWordsPerCW(X=words_reversed, cw=CONTEXT_WINDOW, vocab_size=VOCAB_SIZE,
-                                                          lang=LANG)
-            X_indexed_left, X_indexed_right = input_shifter.shift_input()
             all_inputs = list()
             all_inputs.append(X_indexed)
-            all_inputs += X_indexed_left
-            all_inputs += X_indexed_right
-            padded_indexed_inputs, max_word_len = pad_all_sequences(all_inputs)
-
-            n = pickle_handler.pickle_loader('num_of_indiv_features'+'_'+LANG)
-            decoder_input = get_decoder_input(padded_indexed_inputs[0])
-            padded_indexed_inputs.append(decoder_input)
-
-            num_of_optimized_features = list()
-            if PHONETIC_FLAG is True:
-                extractor = extract_phonetic_features.PhoneticFeatures(sentence)
-                features = extractor.get_features()
-                features = [word_feature[:FEATURE_NUMS] for word_feature in features]
-                tag_grouped_phonetic_features = [list(zip(*features))[idx] for idx in
-                                                 range(len(features[0]))]
-                _ = [padded_indexed_inputs.append(np.array(each)) for each in tag_grouped_phonetic_features]
-                num_of_optimized_features = [len(each) for each in features[0]]
-
-            params = read_path_configs('model_params.yaml')
-            model = _create_model(max_word_len, params['EMBED_DIM'], n, num_of_optimized_features)
-            model.load_weights(get_model_path(paths=paths))
-            pred_outputs = model.predict(padded_indexed_inputs)
-
-            predicted_char_indices = np.argmax(pred_outputs[0], axis=2)
-            predicted_features = [np.argmax(each, axis=1) for each in pred_outputs[1:]]
-            predictions = list()
-            predictions.append(predicted_char_indices)
-            predictions += predicted_features
+            if len(feature_outputs) > 0: # context words only feed the tag heads
+                input_shifter = process_words.ShiftWordsPerCW(X=words_reversed, cw=CONTEXT_WINDOW,
+                                                              vocab_size=VOCAB_SIZE, lang=LANG)
+                X_indexed_left, X_indexed_right = input_shifter.shift_input()
+                all_inputs += X_indexed_left
+                all_inputs += X_indexed_right
+            padded_indexed_inputs, max_word_len = process_words.pad_all_sequences(all_inputs)
+            if len(feature_outputs) == 0:
+                padded_indexed_inputs += [None] * (2*CONTEXT_WINDOW)
+
+            # the tag heads read the decoder input too, so it is built whatever the requested outputs
+            padded_indexed_inputs.append(process_words.get_decoder_input(padded_indexed_inputs[0]))
+
+            if PHONETIC_FLAG is True and IN_GRAPH_PHONETIC_FLAG is False:
+                if len(feature_outputs) > 0:
+                    extractor = extract_phonetic_features.PhoneticFeatures(sentence)
+                    features = extractor.get_features()
+                    features = [word_feature[:FEATURE_NUMS] for word_feature in features]
+                    padded_indexed_inputs += extract_phonetic_features.group_features_by_tag(features)
+                else:
+                    padded_indexed_inputs += [None] * FEATURE_NUMS
+
+            pred_outputs = predictor.predict(padded_indexed_inputs, outputs=REQUESTED_OUTPUTS)
+            predictions.append({name: np.argmax(output, axis=-1) for name, output in zip(REQUESTED_OUTPUTS,
+                                                                                          pred_outputs)})
         _ = write_predicted_roots_and_features(sentences, predictions, paths['output_'+LANG])
 
+    elif MODE == 'sweep':
+        train_val_words, train_val_roots, train_val_features, train_size = _read_train_and_val_data(paths)
+        params = read_path_configs('model_params.yaml')
+        sweep_params = params['SWEEP']
+        stored_cw = max(sweep_params['CONTEXT_WINDOW'])
+        sweep_data_generator = ProcessDataForModel(words=train_val_words, roots=train_val_roots,
+                                                   features=train_val_features)
+        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num = \
+            sweep_data_generator.process_end_to_end(context_window=stored_cw)
+        store_dir = paths.get('sweep_dir', 'sweep/') + LANG
+        write_tensor_store(tensor_store.TensorStore(store_dir), [paths[LANG]['train'], paths[LANG]['validation']],
+                           all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, train_size=train_size,
+                           vocab_len=VOCAB_SIZE+2, context_window=stored_cw)
+        del all_inputs, all_outputs
+        trials = hyperparameter_sweep.get_trials(sweep_params)
+        results = hyperparameter_sweep.run_sweep(trials, store_dir, params, sweep_params)
+        hyperparameter_sweep.write_results(results, store_dir + '/sweep_results.tsv')
+
+    elif MODE == 'stats':
+        all_stats = dict()
+        for split in ['train', 'validation', 'test']:
+            if split in paths[LANG]:
+                all_stats[split] = extract_word_root_and_feature.get_streaming_stats(paths[LANG][split],
+                                                                                     n_features=FEATURE_NUMS,
+                                                                                     lang=LANG, workers=NUM_WORKERS,
+                                                                                     approximate=APPROXIMATE_FLAG)
+        stats_dir = paths.get('stats_output', 'stats/')
+        os.makedirs(stats_dir, exist_ok=True)
+        with open(stats_dir + LANG + '.json', 'w', encoding='utf-8') as f:
+            json.dump(all_stats, f, indent=2)
+        print(json.dumps(all_stats, indent=2))
+
+    elif MODE == 'build_vocab':
+        x_idx2char = process_words.build_vocab_from_files([paths[LANG]['train'], paths[LANG]['validation']],
+                                                          vocab_size=VOCAB_SIZE, lang=LANG, workers=NUM_WORKERS)
+        print(f"Saved vocab of {len(x_idx2char)} indices for {LANG}")
+
+    elif MODE == 'compare':
+        params = read_path_configs('model_params.yaml')
+        registry = model_registry.ModelRegistry(paths, embed_dim=params['EMBED_DIM'], vocab_size=VOCAB_SIZE,
+                                                cw=CONTEXT_WINDOW, batch_size=params['BATCH_SIZE'],
+                                                max_loaded=params['REGISTRY']['MAX_LOADED'],
+                                                idle_seconds=params['REGISTRY']['IDLE_SECONDS'], backend=BACKEND,
+                                                in_graph_phonetic=IN_GRAPH_PHONETIC_FLAG)
+        names = [registry.register(variant) for variant in VARIANTS]
+        print("Variant\t\tLoad (s)\t\tSeconds\t\tMemory (MB)\t\t" + '\t\t'.join(cnn_rnn_with_context.OUTPUT_NAMES))
+        for lang in sorted(set(variant.lang for variant in VARIANTS)):
+            lang_names = [name for name in names if registry.variants[name].lang == lang]
+            contents = extract_word_root_and_feature.get_words_roots_and_features(paths[lang]['test'],
+                                                                                  n_features=FEATURE_NUMS, lang=lang,
+                                                                                  get_stats=False)
+            test_words, test_roots, test_features = \
+                RemoveErroneousIndices(contents, lang=lang).remove_unknown_feature_labels()
+            inputs = model_registry.prepare_inputs(test_words, lang, VOCAB_SIZE, CONTEXT_WINDOW,
+                                                   use_phonetic_features=any(registry.variants[name].phonetic
+                                                                             for name in lang_names))
+            resources = registry.get_resources(lang)
+            for name in lang_names:
+                # loading the weights and building the model for this length is timed apart from predicting
+                start = time.perf_counter()
+                registry.get_predictor(name).warm_up([inputs[0].shape[1]])
+                load_seconds = time.perf_counter() - start
+                predictions, seconds = registry.predict_all(inputs, [name])[name]
+                # measured before the next variant can evict this one from the registry
+                memory = registry.get_memory_usage()[name] / 2**20
+                accuracies = model_registry.get_accuracies(predictions, test_roots, test_features,
+                                                           resources['index_to_char_mapping'],
+                                                           resources['dict_of_encoders'])
+                print(f"{name}\t\t{load_seconds:.2f}\t\t{seconds:.2f}\t\t{memory:.1f}\t\t" +
+                      '\t\t'.join(f"{accuracies[output]:.4f}" for output in cnn_rnn_with_context.OUTPUT_NAMES))
+            registry.unload_idle()
+
+    elif MODE == 'prune':
+        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, train_size = \
+            _load_train_and_val_inputs(paths)
+        params = read_path_configs('model_params.yaml')
+        pruning_params = params['PRUNING']
+        train_inputs, val_inputs = split_train_val(all_inputs, train_size)
+        train_outputs, val_outputs = split_train_val(all_outputs, train_size)
+        calibration_inputs = [np.asarray(each[:pruning_params['CALIBRATION_SAMPLES']]) for each in val_inputs]
+        model_kwargs = get_model_kwargs(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num,
+                                        architecture=pruning.read_architecture(get_model_path(paths=paths)))
+        model_instance = cnn_rnn_with_context.MorphAnalyzerModels(**model_kwargs)
+        model = model_instance.create_and_compile_model(freezer=False)
+        model.load_weights(get_model_path(paths=paths))
+        base_result = pruning.evaluate_model(model, val_inputs, val_outputs, calibration_inputs, params['BATCH_SIZE'])
+        base_result.update({'sparsity': 0.0, 'num_filters': model_instance.num_filters,
+                            'dense_units': model_instance.dense_units, 'speedup': 1.0})
+        results = [base_result]
+        for sparsity in pruning_params['SPARSITIES']:
+            pruned_model, architecture = pruning.prune_model(model, model_kwargs, sparsity,
+                                                             criterion=pruning_params['CRITERION'],
+                                                             calibration_inputs=calibration_inputs,
+                                                             batch_size=params['BATCH_SIZE'])
+            pruned_path = pruning.get_pruned_weights_path(get_model_path(paths=paths), sparsity)
+            pruned_model.fit(train_inputs, train_outputs, validation_data=(val_inputs, val_outputs),
+                             batch_size=params['BATCH_SIZE'], epochs=pruning_params['EPOCHS'],
+                             callbacks=[EarlyStopping(patience=pruning_params['PATIENCE']),
+                                        ModelCheckpoint(filepath=pruned_path, save_best_only=True, verbose=1,
+                                                        save_weights_only=True)])
+            pruned_model.load_weights(pruned_path)
+            pruning.write_architecture(pruned_path, architecture)
+            result = pruning.evaluate_model(pruned_model, val_inputs, val_outputs, calibration_inputs,
+                                            params['BATCH_SIZE'])
+            result.update({'sparsity': sparsity, 'num_filters': architecture['num_filters'],
+                           'dense_units': architecture['dense_units'],
+                           'speedup': result['words_per_second'] / base_result['words_per_second']})
+            print(f"Pruned {sparsity:.0%} -> {pruned_path}: {result}")
+            results.append(result)
+        pruning.write_report(results, os.path.splitext(get_model_path(paths=paths))[0] + '_pruning.tsv')
+
+    elif MODE == 'continue':
+        params = read_path_configs('model_params.yaml')
+        continue_params = params['CONTINUE']
+        new_words, new_roots, new_features = \
+            extract_word_root_and_feature.get_words_roots_and_features(NEW_DATA_PATH or paths[LANG]['new'],
+                                                                       n_features=FEATURE_NUMS, lang=LANG,
+                                                                       get_stats=False)
+        old_encoders, old_n = [pickle_handler.pickle_loader(name+'_'+LANG) for name in ['dict_of_encoders',
+                                                                                        'num_of_indiv_features']]
+        new_words, new_roots, new_features, encoders = \
+            continued_training.apply_label_policy(new_words, new_roots, new_features, old_encoders,
+                                                  policy=LABEL_POLICY or continue_params['LABEL_POLICY'],
+                                                  label_map=continue_params.get('LABEL_MAP'))
+        new_n = [len(encoders[idx].classes_) for idx in range(FEATURE_NUMS)]
+        index_maps = continued_training.get_index_maps(old_encoders, encoders)
+        # context windows are built over each corpus as a whole and only then sampled, so replayed words keep their
+        # real neighbours
+        orig_inputs, orig_outputs, orig_max_word_len, _, phonetic_feature_num, train_size = \
+            _load_train_and_val_inputs(paths)
+        orig_outputs = continued_training.expand_predictions(orig_outputs, index_maps, new_n)
+        new_data_generator = ProcessDataForModel(words=new_words, roots=new_roots, features=new_features,
+                                                 encoders=(encoders, new_n))
+        new_inputs, new_outputs, new_max_word_len, n, _ = new_data_generator.process_end_to_end()
+        max_word_len = max(orig_max_word_len, new_max_word_len)
+        orig_inputs, orig_outputs = continued_training.pad_to_word_length(orig_inputs, orig_outputs, max_word_len,
+                                                                          CONTEXT_WINDOW)
+        new_inputs, new_outputs = continued_training.pad_to_word_length(new_inputs, new_outputs, max_word_len,
+                                                                        CONTEXT_WINDOW)
+        replay = continued_training.sample_replay(train_size, continue_params['REPLAY_RATIO'] * len(new_words))
+        # new samples and replayed original training samples; the original validation set is kept as is
+        train_inputs, train_outputs = [[np.concatenate([new, np.asarray(orig[replay])]) for new, orig in
+                                        zip(new_arrays, orig_arrays)] for new_arrays, orig_arrays in
+                                       [(new_inputs, orig_inputs), (new_outputs, orig_outputs)]]
+        val_inputs, val_outputs = [[np.asarray(each[train_size:]) for each in arrays] for arrays in
+                                   [orig_inputs, orig_outputs]]
+
+        weights_path = get_model_path(paths=paths)
+        architecture = pruning.read_architecture(weights_path)
+        old_model = _create_model(max_word_len, params['EMBED_DIM'], old_n, phonetic_feature_num,
+                                  architecture=architecture)
+        old_model.load_weights(weights_path)
+        before = pruning.get_output_accuracies(
+            continued_training.expand_predictions(old_model.predict(val_inputs, batch_size=params['BATCH_SIZE']),
+                                                  index_maps, n), val_outputs)
+        model = _create_model(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num,
+                              freezing_call=FREEZER_FLAG, architecture=architecture)
+        continued_training.transfer_weights(old_model, model, index_maps)
+        if FREEZER_FLAG is True: # a model trained with frozen layers is continued with the same layers frozen
+            for layer_to_be_frozen in get_frozen_layer_names():
+                try:
+                    model.get_layer(layer_to_be_frozen).trainable = False
+                except ValueError:
+                    pass
+            model.compile(optimizer='adadelta', loss='categorical_crossentropy', metrics=['accuracy'])
+        # the production weights and pickles are only replaced together, once training is over and did not regress
+        candidate_path = continued_training.get_candidate_path(weights_path)
+        hist = model.fit(train_inputs, train_outputs, validation_data=(val_inputs, val_outputs),
+                         batch_size=params['BATCH_SIZE'], epochs=continue_params['EPOCHS'],
+                         callbacks=[EarlyStopping(patience=continue_params['PATIENCE']),
+                                    ModelCheckpoint(filepath=candidate_path, save_best_only=True,
+                                                    verbose=1, save_weights_only=True)])
+        model.load_weights(candidate_path)
+        after = pruning.get_output_accuracies(model.predict(val_inputs, batch_size=params['BATCH_SIZE']), val_outputs)
+        print(f"Trained on {len(new_words)} new and {len(replay)} replayed samples; drift on the original "
+              f"validation set:")
+        continued_training.print_drift(before, after)
+        if continued_training.is_regression(before, after, continue_params['MAX_ACCURACY_DROP']):
+            print(f"Accuracy dropped by more than {continue_params['MAX_ACCURACY_DROP']} on some output; keeping "
+                  f"the current model, the continued weights are left at {candidate_path}")
+        else:
+            if new_n != list(old_n):
+                _ = [pickle_handler.pickle_dumper(obj, name+'_'+LANG) for obj, name in
+                     zip([encoders, new_n, [list(encoders[idx].classes_) for idx in range(FEATURE_NUMS)],
+                          [list(range(num)) for num in new_n]],
+                         ['dict_of_encoders', 'num_of_indiv_features', 'class_labels_orig',
+                          'class_labels_transformed'])]
+            continued_training.promote_weights(candidate_path, weights_path)
+            print(f"Saved the continued model to {weights_path}")
+
+    elif MODE in ['parallel_train', 'scaling']:
+        # workers read their shards from the tensor store, so it is always written
+        all_inputs, all_outputs, max_word_len, n, phonetic_feature_num, train_size = \
+            _load_train_and_val_inputs(paths, use_store=True)
+        params = read_path_configs('model_params.yaml')
+        parallel_params = params['PARALLEL']
+        model_kwargs = get_model_kwargs(max_word_len, params['EMBED_DIM'], n, phonetic_feature_num)
+        model = cnn_rnn_with_context.MorphAnalyzerModels(**model_kwargs).create_and_compile_model(freezer=False)
+        store_dir = get_tensor_store(paths, 'train').store_dir
+        # each worker runs THREADS_PER_WORKER threads, so by default there are only as many workers as that fills
+        num_workers = args['workers'] or data_parallel.get_default_num_workers(parallel_params['THREADS_PER_WORKER'])
+        if MODE == 'scaling':
+            results = data_parallel.measure_scaling(model, model_kwargs, store_dir,
+                                                    data_parallel.get_worker_counts(num_workers),
+                                                    threads_per_worker=parallel_params['THREADS_PER_WORKER'],
+                                                    batch_size=params['BATCH_SIZE'],
+                                                    sync_batches=parallel_params['SYNC_BATCHES'],
+                                                    num_samples=min(train_size, parallel_params['SCALING_SAMPLES']))
+            print("Workers\t\tSeconds\t\tSamples/sec\t\tSpeedup\t\tEfficiency")
+            for result in results:
+                print(f"{result['workers']}\t\t{result['seconds']:.2f}\t\t{result['samples_per_second']:.1f}\t\t"
+                      f"{result['speedup']:.2f}x\t\t{result['efficiency']:.1%}")
+            data_parallel.write_scaling_report(results, store_dir + '/scaling.tsv')
+        else:
+            _, val_inputs = split_train_val(all_inputs, train_size)
+            _, val_outputs = split_train_val(all_outputs, train_size)
+            trainer = data_parallel.DataParallelTrainer(model, model_kwargs, store_dir, num_workers,
+                                                        threads_per_worker=parallel_params['THREADS_PER_WORKER'],
+                                                        batch_size=params['BATCH_SIZE'],
+                                                        sync_batches=parallel_params['SYNC_BATCHES'])
+            trainer.start()
+            try:
+                hist = trainer.fit(val_inputs, val_outputs, epochs=params['EPOCHS'],
+                                   callbacks=[EarlyStopping(patience=10),
+                                              ModelCheckpoint(filepath=get_model_path(paths=paths),
+                                                              save_best_only=True, verbose=1,
+                                                              save_weights_only=True)])
+            finally:
+                trainer.stop()
+
+    elif MODE == 'export':
+        params = read_path_configs('model_params.yaml')
+        # one graph per exact word length: padding words to a longer graph changes the outputs
+        word_lengths = list(range(1, params['EXPORT']['MAX_WORD_LEN'] + 1))
+        registry = model_registry.ModelRegistry(paths, embed_dim=params['EMBED_DIM'], vocab_size=VOCAB_SIZE,
+                                                cw=CONTEXT_WINDOW, batch_size=params['BATCH_SIZE'],
+                                                in_graph_phonetic=IN_GRAPH_PHONETIC_FLAG)
+        print("Variant\t\tKeras cold start (s)\t\tFrozen cold start (s)\t\tSpeedup")
+        for variant in VARIANTS:
+            name = registry.register(variant)
+            if not os.path.exists(model_registry.get_weights_path(paths, variant.lang, variant.phonetic,
+                                                                  variant.freezing)):
+                print(f"{name}\t\tno trained weights, skipped")
+                continue
+            model_builder = registry.get_model_builder(variant)
+            graph_export.export_variant(model_builder, get_export_dir(paths, variant), word_lengths,
+                                        [resource+'_'+variant.lang for resource in EXPORT_RESOURCES],
+                                        [resource+'_'+variant.lang for resource in VOCAB_RESOURCES],
+                                        metadata={'variant': name, 'lang': variant.lang,
+                                                  'phonetic': variant.phonetic, 'freezing': variant.freezing,
+                                                  'in_graph_phonetic': IN_GRAPH_PHONETIC_FLAG and variant.phonetic,
+                                                  'weights_version': graph_export.get_weights_version(
+                                                      model_registry.get_weights_path(paths, variant.lang,
+                                                                                      variant.phonetic,
+                                                                                      variant.freezing))})
+            _ = graph_export.check_export(model_builder, get_export_dir(paths, variant), MAX_WORD_LEN,
+                                          vocab_len=VOCAB_SIZE+2, batch_size=params['BATCH_SIZE'])
+            timings = graph_export.benchmark_cold_start(model_builder, get_export_dir(paths, variant),
+                                                        MAX_WORD_LEN, batch_size=params['BATCH_SIZE'])
+            print(f"{name}\t\t{timings['keras']:.2f}\t\t{timings['frozen']:.2f}\t\t"
+                  f"{timings['keras'] / timings['frozen']:.1f}x")
+
+    elif MODE == 'tune':
+        params = read_path_configs('model_params.yaml')
+        tuner_params = params['TUNER']
+        test_words = extract_word_root_and_feature.get_words_roots_and_features(paths[LANG]['test'],
+                                                                                n_features=FEATURE_NUMS, lang=LANG,
+                                                                                get_stats=False)[0]
+        n = pickle_handler.pickle_loader('num_of_indiv_features'+'_'+LANG)
+        phonetic_feature_num = extract_phonetic_features.get_phonetic_feature_nums() if PHONETIC_FLAG else None
+        prepare_batch = partial(model_registry.prepare_inputs, lang=LANG, vocab_size=VOCAB_SIZE, cw=CONTEXT_WINDOW,
+                                use_phonetic_features=PHONETIC_FLAG and not IN_GRAPH_PHONETIC_FLAG)
+        results = inference_tuner.tune(lambda settings: _create_predictor(paths, params['EMBED_DIM'], n,
+                                                                          phonetic_feature_num, params['BATCH_SIZE'],
+                                                                          settings=settings),
+                                       prepare_batch, test_words[:tuner_params['SAMPLE_WORDS']],
+                                       inference_tuner.get_configs(tuner_params),
+                                       latency_budget_ms=tuner_params.get('LATENCY_BUDGET_MS'))
+        inference_tuner.write_profile(get_inference_profile_dir(paths), get_export_name(), BACKEND, results[0])
+        profile_dir = paths.get('profile_output', 'profiles/')
+        os.makedirs(profile_dir, exist_ok=True)
+        inference_tuner.write_results(results, profile_dir + get_export_name() + '_' + BACKEND + '_tuning.tsv')
+        print(f"Saved the {get_export_name()} {BACKEND} profile to "
+              f"{inference_tuner.get_profile_path(get_inference_profile_dir(paths))}: {results[0]}")
+
+    elif MODE == 'profile':
+        params = read_path_configs('model_params.yaml')
+        batch_size = BATCH_SIZE or params['BATCH_SIZE']
+        n = pickle_handler.pickle_loader('num_of_indiv_features'+'_'+LANG)
+        phonetic_feature_num = extract_phonetic_features.get_phonetic_feature_nums() if PHONETIC_FLAG else None
+        K.set_learning_phase(0)
+        model = _create_model(MAX_WORD_LEN, params['EMBED_DIM'], n, phonetic_feature_num, freezing_call=True)
+        rows = layer_profiler.LayerProfiler(model, batch_size=batch_size).profile(vocab_len=VOCAB_SIZE+2)
+        groups = layer_profiler.summarize_by_group(rows)
+        layer_profiler.print_report(rows, groups)
+        profile_dir = paths.get('profile_output', 'profiles/')
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_name = profile_dir + '_'.join([LANG, 'phonetic' if PHONETIC_FLAG else 'plain', str(MAX_WORD_LEN),
+                                               str(batch_size)])
+        layer_profiler.write_csv(rows, profile_name + '.csv')
+        layer_profiler.write_json(rows, groups, {'lang': LANG, 'phonetic': PHONETIC_FLAG,
+                                                 'in_graph_phonetic': IN_GRAPH_PHONETIC_FLAG,
+                                                 'max_word_len': MAX_WORD_LEN, 'batch_size': batch_size,
+                                                 'params': model.count_params()}, profile_name + '.json')
+
+    elif MODE == 'tokenize_benchmark':
+        tokenizer_params = read_path_configs('model_params.yaml')['TOKENIZER']
+        vocab = frozenset(pickle_handler.pickle_loader('index_to_char_mapping'+'_'+LANG))
+        with open(paths[LANG+'_predict_input'], 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        results = normalize_text.benchmark(lines, vocab=vocab, workers=NUM_WORKERS,
+                                           repeats=tokenizer_params['BENCHMARK_REPEATS'])
+        print("Tokenizer\tLines/sec\tTokens/sec\tChar OOV rate")
+        for name, result in results.items():
+            print(f"{name}\t\t{result['lines_per_second']:.0f}\t\t{result['tokens_per_second']:.0f}\t\t"
+                  f"{result.get('char_oov_rate', float('nan')):.4f}")
+        print(f"Token cache hit rate: {results['serial']['cache_hit_rate']:.4f}")
 
 
 if __name__ == "__main__":
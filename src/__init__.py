@@ -1,3 +1,5 @@
-from src.models import cnn_rnn_with_context
-from src.eval import evaluate_and_plot
-from src.processor import process_words, extract_word_root_and_feature
+from src.models import cnn_rnn_with_context, compiled_inference, hyperparameter_sweep, model_registry, \
+    pruning, data_parallel, continued_training, graph_export, inference_tuner
+from src.eval import evaluate_and_plot, layer_profiler
+from src.processor import process_words, extract_word_root_and_feature, tensor_store, decode_outputs, \
+    deduplicate, normalize_text
@@ -0,0 +1,168 @@
+import csv
+import json
+import re
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+
+LAYER_GROUPS = [('context_embedding', r'^(embedding_common_|drop\d|noise\d)'),
+                ('conv_branches', r'^(Conv|MaxPool|AvgPool|Merge_)'),
+                ('context_rnn', r'^(main_merge|drop_1$|gru_1$)'),
+                ('phonetic', r'^(phonetic_|dense_phonetic_|dropout_phonetic_)'),
+                ('tag_heads', r'^(dense1_|drop_2_|output)'),
+                ('root_seq2seq', r'^(embedding_encoder|embedding_decoder|encoder|decoder|dot\d|attention|concatenate|'
+                                 r'time_dist_)')]
+CSV_COLUMNS = ['layer', 'group', 'type', 'params', 'flops', 'activation_bytes', 'latency_ms']
+
+
+def get_layer_group(layer_name):
+    for group, pattern in LAYER_GROUPS:
+        if re.match(pattern, layer_name):
+            return group
+    return 'other'
+
+
+def as_list(x):
+    return x if isinstance(x, list) else [x]
+
+
+def get_shapes(shapes):
+    """Normalises a layer's input/output shape (one tuple or a list of them) to a list of tuples without batch."""
+    return [tuple(shape[1:]) for shape in (shapes if isinstance(shapes, list) else [shapes])]
+
+
+def get_rnn_flops(cell_layer, timesteps, input_dim):
+    units = cell_layer.units
+    gates = 4 if cell_layer.__class__.__name__ == 'LSTM' else 3
+    return timesteps * gates * 2 * (input_dim*units + units*units + units)
+
+
+def estimate_flops(layer):
+    """Rough per-sample FLOPs of one layer (a multiply-add counts as 2); zero for lookups, reshapes and no-ops."""
+    layer_type = layer.__class__.__name__
+    input_shapes, output_shapes = get_shapes(layer.input_shape), get_shapes(layer.output_shape)
+    output_size = int(np.prod(output_shapes[0]))
+    if layer_type == 'TimeDistributed':
+        return input_shapes[0][0] * 2 * input_shapes[0][-1] * layer.layer.units
+    if layer_type == 'Dense':
+        return 2 * input_shapes[0][-1] * layer.units
+    if layer_type == 'Conv1D':
+        return output_size * 2 * layer.kernel_size[0] * input_shapes[0][-1]
+    if layer_type in ['MaxPooling1D', 'AveragePooling1D']:
+        return output_size * layer.pool_size[0]
+    if layer_type == 'Bidirectional':
+        return 2 * get_rnn_flops(layer.forward_layer, input_shapes[0][0], input_shapes[0][-1])
+    if layer_type in ['GRU', 'LSTM', 'SimpleRNN']:
+        return get_rnn_flops(layer, input_shapes[0][0], input_shapes[0][-1])
+    if layer_type == 'Dot':
+        return output_size * 2 * input_shapes[0][layer.axes[0] - 1]
+    if layer_type == 'Activation':
+        return 3 * output_size
+    if layer_type == 'PhoneticFeatureLookup':
+        return int(np.prod(input_shapes[0])) * output_size
+    return 0
+
+
+def get_activation_bytes(layer, batch_size):
+    return sum(4 * batch_size * int(np.prod(shape)) for shape in get_shapes(layer.output_shape))
+
+
+class LayerProfiler():
+    """Attributes parameters, estimated FLOPs, activation memory and CPU latency of a model to its named layers.
+
+    Every layer's inputs are first computed once for a random batch. Each layer is then timed on its own by a backend
+    function fed with those recorded inputs, so a layer's latency does not include the layers before it.
+    """
+    def __init__(self, model, batch_size=128, repeats=10, seed=0):
+        self.model = model
+        self.batch_size = batch_size
+        self.repeats = repeats
+        self.random_state = np.random.RandomState(seed)
+        self.layers = [layer for layer in model.layers if layer.__class__.__name__ != 'InputLayer']
+
+    def get_random_inputs(self, vocab_len):
+        inputs = list()
+        for name, model_input in zip(self.model.input_names, self.model.inputs):
+            shape = (self.batch_size,) + K.int_shape(model_input)[1:]
+            if name.startswith('input_'):
+                inputs.append(self.random_state.randint(1, vocab_len, size=shape).astype('float32'))
+            else:
+                inputs.append(self.random_state.randint(0, 2, size=shape).astype('float32'))
+        return inputs
+
+    def record_layer_inputs(self, inputs):
+        tensors = list()
+        for layer in self.layers:
+            tensors.extend(tensor for tensor in as_list(layer.input) if tensor not in tensors)
+        values = K.function(self.model.inputs, tensors)(inputs)
+        return tensors, values
+
+    def time_layer(self, layer, values_by_tensor, inputs):
+        layer_inputs = as_list(layer.input)
+        function = K.function(layer_inputs, as_list(layer.output))
+        feed = [values_by_tensor[tensor] for tensor in layer_inputs]
+        try:
+            _ = function(feed)
+        except tf.errors.InvalidArgumentError:
+            # the layer also reads a tensor that is not one of its Keras inputs (e.g. the decoder's initial state),
+            # so the model inputs are fed too and its latency includes computing that tensor
+            function = K.function(layer_inputs + self.model.inputs, as_list(layer.output))
+            feed = feed + inputs
+            _ = function(feed)
+        timings = list()
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            _ = function(feed)
+            timings.append(time.perf_counter() - start)
+        return 1000 * float(np.median(timings))
+
+    def profile(self, vocab_len):
+        inputs = self.get_random_inputs(vocab_len)
+        tensors, values = self.record_layer_inputs(inputs)
+        values_by_tensor = {tensor: value for tensor, value in zip(tensors, values)}
+        rows = list()
+        for layer in self.layers:
+            rows.append({'layer': layer.name, 'group': get_layer_group(layer.name), 'type': layer.__class__.__name__,
+                         'params': int(layer.count_params()),
+                         'flops': int(self.batch_size * estimate_flops(layer)),
+                         'activation_bytes': get_activation_bytes(layer, self.batch_size),
+                         'latency_ms': self.time_layer(layer, values_by_tensor, inputs)})
+        return rows
+
+
+def summarize_by_group(rows):
+    total_latency = sum(row['latency_ms'] for row in rows) or 1.0
+    groups = dict()
+    for row in rows:
+        group = groups.setdefault(row['group'], {'layers': 0, 'params': 0, 'flops': 0, 'activation_bytes': 0,
+                                                 'latency_ms': 0.0})
+        group['layers'] += 1
+        for key in ['params', 'flops', 'activation_bytes', 'latency_ms']:
+            group[key] += row[key]
+    for group in groups.values():
+        group['latency_share'] = group['latency_ms'] / total_latency
+    return dict(sorted(groups.items(), key=lambda item: item[1]['latency_ms'], reverse=True))
+
+
+def write_csv(rows, output_path):
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json(rows, groups, config, output_path):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'config': config, 'groups': groups, 'layers': rows}, f, indent=2)
+
+
+def print_report(rows, groups, top_k=15):
+    print("Group\t\tLayers\t\tParams\t\tMFLOPs\t\tActivations (MB)\t\tLatency (ms)\t\tShare")
+    for name, group in groups.items():
+        print(f"{name}\t\t{group['layers']}\t\t{group['params']}\t\t{group['flops'] / 1e6:.1f}\t\t"
+              f"{group['activation_bytes'] / 2**20:.2f}\t\t{group['latency_ms']:.2f}\t\t{group['latency_share']:.1%}")
+    print("\nLayer\t\tType\t\tMFLOPs\t\tLatency (ms)")
+    for row in sorted(rows, key=lambda row: row['latency_ms'], reverse=True)[:top_k]:
+        print(f"{row['layer']}\t\t{row['type']}\t\t{row['flops'] / 1e6:.1f}\t\t{row['latency_ms']:.2f}")
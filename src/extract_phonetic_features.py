@@ -1,3 +1,7 @@
+from collections import Counter
+
+import numpy as np
+
 svar_features = {
     'samvrit': [u'\u0907', u'\u0908', u'\u0909', u'\u090A', u'\u093F',
                 u'\u0940', u'\u0941', u'\u0942'],
@@ -160,6 +164,43 @@ class PhoneticFeatures():
         all_features = [self.surface_features(word) for word in self.words]
         return all_features
 
+
+def get_phonetic_feature_nums():
+    return [len(each) for each in PhoneticFeatures([]).get_optimized_features_for_word('')]
+
+
+def group_features_by_tag(features):
+    """Regroups per-word [head_0, ..., head_5] feature lists into one (words, head_dim) array per tag head."""
+    return [np.array(each) for each in zip(*features)]
+
+
+def get_char_feature_tables(idx_to_char, vocab_len=None):
+    """Per tag head, a (vocab_len, head_dim) table of each char's features and a mask of its count-valued columns.
+
+    A word's count features are the sum of its chars' rows and its boolean ones their max, so the tables reproduce
+    `get_optimized_features_for_word` from char indices. Index 0 (start/padding token) maps to zeros.
+    """
+    extractor = PhoneticFeatures([])
+    probe = extractor.get_optimized_features_for_word('')
+    count_masks = [np.array([not isinstance(value, bool) for value in head]) for head in probe]
+    tables = [np.zeros((vocab_len or len(idx_to_char), len(head)), dtype='float32') for head in probe]
+    for idx, char in enumerate(idx_to_char[1:], 1):
+        for table, head in zip(tables, extractor.get_optimized_features_for_word(char)):
+            table[idx] = head
+    return list(zip(tables, count_masks))
+
+
+def count_dropped_feature_chars(words, idx_to_char):
+    """Counts the chars outside the vocab that have phonetic features of their own.
+
+    They are indexed as 'U', so features computed from char indices miss what `PhoneticFeatures` finds in them.
+    """
+    vocab = set(idx_to_char)
+    oov_chars = Counter(char for word in words for char in word if char not in vocab)
+    return Counter({char: count for char, count in oov_chars.items()
+                    if any(any(head) for head in PhoneticFeatures([]).get_optimized_features_for_word(char))})
+
+
 if __name__ == '__main__':
     inputs = 'रेगिस्तान का मुसाफिर एक बूँद को प्यासा होता है |'
     words = inputs.split(' ')
@@ -1,4 +1,6 @@
-from collections import defaultdict
+import hashlib
+import math
+from collections import Counter, defaultdict
 
 class DataStats(object):
     def __init__(self, sentences, features):
@@ -35,4 +37,99 @@ class DataStats(object):
         return total_words, total_unique_words, total_ambiguous_words, total_unambiguous_words
 
     def get_complete_stats(self):
-        return [self.get_sentence_level_stats(), self.get_word_level_stats(), self.get_tag_level_stats()]
\ No newline at end of file
+        return [self.get_sentence_level_stats(), self.get_word_level_stats(), self.get_tag_level_stats()]
+
+
+class HyperLogLog(object):
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, item):
+        value = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        idx = value >> (64 - self.precision)
+        remainder = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(i, j) for i, j in zip(self.registers, other.registers))
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.num_registers)
+        raw_estimate = alpha * self.num_registers ** 2 / sum(2.0 ** -register for register in self.registers)
+        num_zeros = self.registers.count(0)
+        if raw_estimate <= 2.5 * self.num_registers and num_zeros > 0:
+            return self.num_registers * math.log(self.num_registers / num_zeros)
+        return raw_estimate
+
+
+class StreamingStats(object):
+    """Per-shard accumulator for the same statistics as `DataStats`, fed one sentence at a time.
+
+    Accumulators from different shards are combined with `merge`. With `approximate=True` the number of types and
+    of distinct (word, tags) readings are estimated with HyperLogLog sketches instead of keeping every word, so
+    ambiguity is only reported as the estimated number of extra readings.
+    """
+    def __init__(self, n_tags=6, approximate=False):
+        self.approximate = approximate
+        self.num_sentences = 0
+        self.num_tokens = 0
+        self.sentence_lengths = Counter()
+        self.tag_counters = [Counter() for _ in range(n_tags)]
+        if approximate:
+            self.word_sketch, self.reading_sketch = HyperLogLog(), HyperLogLog()
+        else:
+            self.word_readings = dict()  # word -> its only tag tuple so far, or None once it is ambiguous
+
+    def update(self, words, features):
+        self.num_sentences += 1
+        self.num_tokens += len(words)
+        self.sentence_lengths[len(words)] += 1
+        for word, feature in zip(words, features):
+            for counter, value in zip(self.tag_counters, feature):
+                counter[value] += 1
+            if self.approximate:
+                self.word_sketch.add(word)
+                self.reading_sketch.add(word + '\t' + '|'.join(feature))
+            elif word not in self.word_readings:
+                self.word_readings[word] = feature
+            elif self.word_readings[word] != feature:
+                self.word_readings[word] = None
+
+    def merge(self, other):
+        self.num_sentences += other.num_sentences
+        self.num_tokens += other.num_tokens
+        self.sentence_lengths.update(other.sentence_lengths)
+        for counter, other_counter in zip(self.tag_counters, other.tag_counters):
+            counter.update(other_counter)
+        if self.approximate:
+            self.word_sketch.merge(other.word_sketch)
+            self.reading_sketch.merge(other.reading_sketch)
+        else:
+            for word, reading in other.word_readings.items():
+                if word not in self.word_readings:
+                    self.word_readings[word] = reading
+                elif self.word_readings[word] != reading:
+                    self.word_readings[word] = None
+        return self
+
+    def to_dict(self):
+        stats = {'sentences': self.num_sentences, 'tokens': self.num_tokens,
+                 'mean_sentence_length': self.num_tokens / self.num_sentences if self.num_sentences else 0.0,
+                 'max_sentence_length': max(self.sentence_lengths) if self.sentence_lengths else 0,
+                 'sentence_length_histogram': {str(length): cnt for length, cnt in
+                                               sorted(self.sentence_lengths.items())},
+                 'tag_cardinalities': [len(counter) for counter in self.tag_counters],
+                 'approximate': self.approximate}
+        if self.approximate:
+            num_types = int(round(self.word_sketch.estimate()))
+            stats.update({'types': num_types,
+                          'extra_readings': max(0, int(round(self.reading_sketch.estimate())) - num_types)})
+        else:
+            num_ambiguous = sum(1 for reading in self.word_readings.values() if reading is None)
+            stats.update({'types': len(self.word_readings), 'ambiguous_types': num_ambiguous,
+                          'unambiguous_types': len(self.word_readings) - num_ambiguous})
+        return stats
@@ -1,17 +1,34 @@
+import hashlib
+import os
 import pickle
 import gzip
 
+RESOURCE_DIR = 'resources/' # where handlers without their own directory read and write
+
 
 class PickleHandler():
-    def __init__(self):
-        pass
+    def __init__(self, resource_dir=None):
+        self.resource_dir = resource_dir
+
+    def get_resource_dir(self):
+        return self.resource_dir or RESOURCE_DIR
+
+    def get_path(self, name):
+        return os.path.join(self.get_resource_dir(), name + '.gzip')
 
-    @staticmethod
-    def pickle_dumper(obj, name):
-        pickle.dump(obj, gzip.open('resources/' + name + '.gzip', 'wb'))
+    def pickle_dumper(self, obj, name):
+        pickle.dump(obj, gzip.open(self.get_path(name), 'wb'))
 
-    @staticmethod
-    def pickle_loader(name):
-        obj = pickle.load(gzip.open('resources/' + name + '.gzip', 'rb'))
+    def pickle_loader(self, name):
+        obj = pickle.load(gzip.open(self.get_path(name), 'rb'))
         return obj
 
+    def get_version(self, names):
+        digest = hashlib.sha1()
+        for name in names:
+            path = self.get_path(name)
+            if not os.path.exists(path):
+                return None
+            with gzip.open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
@@ -7,25 +7,65 @@ from keras.models import Model
 from keras.optimizers import Adadelta
 from keras.constraints import maxnorm
 
+from src.models.phonetic_layer import PhoneticFeatureLookup
+
+OUTPUT_NAMES = ['root', 'POS', 'gender', 'number', 'person', 'case', 'TAM']
+OUTPUT_LAYER_NAMES = ['time_dist_2'] + ['output' + str(idx) for idx in range(len(OUTPUT_NAMES) - 1)]
+
+
+def get_required_input_names(input_names, outputs):
+    """Returns the model inputs that the requested outputs depend on.
+
+    The root decoder only reads the current word and the decoder input; the tag heads read every word input, the
+    decoder input included, through the shared convolutions and `gru_1`.
+    """
+    word_input_names = [name for name in input_names if name.startswith('input_')]
+    use_phonetic_features = any(name.startswith('phonetic_') for name in input_names)
+    required_names = set()
+    for output in outputs:
+        if output == 'root':
+            required_names.update([word_input_names[0], word_input_names[-1]]) # current word and decoder input
+        else:
+            required_names.update(word_input_names)
+            if use_phonetic_features:
+                required_names.add('phonetic_' + str(OUTPUT_NAMES.index(output) - 1))
+    return [name for name in input_names if name in required_names]
+
+
+def select_outputs(model, outputs):
+    """Builds a model sharing `model`'s layers that only computes `outputs` (a subset of OUTPUT_NAMES)."""
+    outputs = sorted(outputs, key=OUTPUT_NAMES.index)
+    required_names = get_required_input_names(model.input_names, outputs)
+    inputs = [tensor for name, tensor in zip(model.input_names, model.inputs) if name in required_names]
+    output_tensors = [model.get_layer(OUTPUT_LAYER_NAMES[OUTPUT_NAMES.index(output)]).output for output in outputs]
+    return Model(inputs=inputs, outputs=output_tensors)
+
 
 class MorphAnalyzerModels():
     def __init__(self, max_word_len, vocab_len, embedding_dim,
-                 list_of_feature_nums, cw, use_phonetic_features=False, phonetic_dims=None):
+                 list_of_feature_nums, cw, use_phonetic_features=False, phonetic_dims=None, num_filters=64,
+                 filter_len=4, rnn_output_size=32, dropout_rate=0.3, phonetic_tables=None, dense_units=None,
+                 attention_units=None):
         self.max_len = max_word_len
         self.vocab_size = vocab_len
         self.embed_dim = embedding_dim
-        self.num_filters = 64
-        self.filter_len = 4
+        self.num_filters = num_filters
+        self.filter_len = filter_len
         self.hidden_dim = self.num_filters*2
+        # both default to the sizes derived from num_filters; set explicitly by pruned models
+        self.dense_units = dense_units or self.hidden_dim
+        self.attention_units = attention_units or int(self.hidden_dim/2)
         self.rnn = GRU
-        self.rnn_output_size = 32
-        self.dropout_rate = 0.3
+        self.rnn_output_size = rnn_output_size
+        self.dropout_rate = dropout_rate
         self.num_strides = 1
         self.list_of_feature_classes = list_of_feature_nums
         self.window = cw
         self.use_phonetic_flag = use_phonetic_features
         if self.use_phonetic_flag:
             self.phonetic_dims = phonetic_dims
+        # (char_table, count_mask) per head: phonetic features are computed in-graph from the current word
+        self.phonetic_tables = phonetic_tables if self.use_phonetic_flag else None
 
     def apply_conv_and_pooling(self, inputs, kernel_size):
         convolutions = [Conv1D(filters=self.num_filters, kernel_size=kernel_size, padding='same', activation='relu',
@@ -48,7 +88,7 @@ class MorphAnalyzerModels():
     def define_input_layers(self):
         input_layers = [Input(shape=(self.max_len,), dtype='float32', name='input_' + str(idx)) for idx in
                         range(2*self.window + 2)] # 2 = 1(current word) + 1(decoder_input)
-        if self.use_phonetic_flag is True:
+        if self.use_phonetic_flag is True and self.phonetic_tables is None:
             phonetic_inputs = [Input(shape=(num,), dtype='float32', name='phonetic_' + str(idx)) for idx, num in
                                enumerate(self.phonetic_dims)]
             input_layers.extend(phonetic_inputs)
@@ -56,29 +96,33 @@ class MorphAnalyzerModels():
 
     def cnn_rnn(self):
         all_input_layers = self.define_input_layers()
-        if self.use_phonetic_flag is True:
+        if self.phonetic_tables is not None:
+            input_layers = all_input_layers
+            phonetic_inputs = [PhoneticFeatureLookup(table, count_mask, name='phonetic_lookup_' + str(idx))(input_layers[0])
+                               for idx, (table, count_mask) in enumerate(self.phonetic_tables)]
+        elif self.use_phonetic_flag is True:
             phonetic_inputs = all_input_layers[-len(self.phonetic_dims):]
-
-        input_layers = all_input_layers[:len(all_input_layers) - len(self.phonetic_dims)] if self.use_phonetic_flag \
-            else all_input_layers
+            input_layers = all_input_layers[:len(all_input_layers) - len(self.phonetic_dims)]
+        else:
+            input_layers = all_input_layers
 
         embedding_layers = self.apply_embedding(input_layers, mask_flag=False, _name='common')
         dropouts_1 = [Dropout(self.dropout_rate, name='drop'+str(idx))(embeddings) for idx, embeddings in
                       enumerate(embedding_layers)]
         noises = [GaussianNoise(.05, name='noise'+str(idx))(dropout) for idx, dropout in enumerate(dropouts_1)]
-        convolution_4 = self.apply_conv_and_pooling(inputs=noises, kernel_size=4)
-        convolution_5 = self.apply_conv_and_pooling(inputs=noises, kernel_size=5)
+        convolution_4 = self.apply_conv_and_pooling(inputs=noises, kernel_size=self.filter_len)
+        convolution_5 = self.apply_conv_and_pooling(inputs=noises, kernel_size=self.filter_len+1)
         merge_convolutions = concatenate(convolution_4+convolution_5,  name='main_merge')
         dropouts_2 = Dropout(self.dropout_rate, name='drop_1')(merge_convolutions)
         last_layers = [Bidirectional(self.rnn(self.rnn_output_size), name='gru_1')(dropouts_2)]
         if self.use_phonetic_flag is True:
             all_features = [concatenate([last_layer, phonetic_input],  name='phonetic_merge_'+str(idx))
                             for idx, phonetic_input in enumerate(phonetic_inputs) for last_layer in last_layers]
-            dense_phonetics =  [Dense(self.hidden_dim, activation='relu', kernel_initializer='he_normal', kernel_constraint=maxnorm(3),
+            dense_phonetics =  [Dense(self.dense_units, activation='relu', kernel_initializer='he_normal', kernel_constraint=maxnorm(3),
                         bias_constraint=maxnorm(3), name='dense_phonetic_'+str(idx))(feature) for idx, feature in enumerate(all_features)]
             last_layers = [Dropout(self.dropout_rate, name='dropout_phonetic_'+str(idx))(dense_phonetic)
                            for idx, dense_phonetic in enumerate(dense_phonetics)]
-        dense_1s = [Dense(self.hidden_dim, activation='relu', kernel_initializer='he_normal', kernel_constraint=maxnorm(3),
+        dense_1s = [Dense(self.dense_units, activation='relu', kernel_initializer='he_normal', kernel_constraint=maxnorm(3),
                         bias_constraint=maxnorm(3), name='dense1_'+str(idx))(last_layer) for idx, last_layer in
                         enumerate(last_layers)]
         dropouts_3 = [Dropout(self.dropout_rate, name='drop_2_' + str(idx))(dense) for idx, dense in enumerate(dense_1s)]
@@ -101,7 +145,7 @@ class MorphAnalyzerModels():
         attention = Activation('softmax', name='attention')(dot_product_1)
         dot_product_2 = dot([attention, encoder], axes=[2,1], name='dot2')
         decoder_context_combined = concatenate([dot_product_2, decoder], name='concatenate')
-        outputs = TimeDistributed(Dense(int(self.hidden_dim/2), activation='tanh'), name='time_dist_1')(decoder_context_combined)
+        outputs = TimeDistributed(Dense(self.attention_units, activation='tanh'), name='time_dist_1')(decoder_context_combined)
         output_final = TimeDistributed(Dense(self.vocab_size, activation='softmax'), name='time_dist_2')(outputs)
         ################## End of seq2seq model ###########################
 
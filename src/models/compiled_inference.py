@@ -0,0 +1,175 @@
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from tensorflow.contrib.compiler import jit
+
+from src.models import cnn_rnn_with_context
+
+
+def get_bucket_length(max_word_len, bucket_size=None):
+    """Length the inputs are padded to. Without a bucket size every length gets its own model: the GRU encoder is
+    unmasked and the attention covers every step, so padding words further changes the outputs."""
+    if not bucket_size:
+        return max_word_len
+    return int(np.ceil(max_word_len / bucket_size) * bucket_size)
+
+
+def get_session_config(intra_op_threads=0, inter_op_threads=0, use_xla=False):
+    # session level JIT only clusters GPU ops in TF1; CPU ops are compiled through the jit scope in CompiledPredictor
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads)
+    if use_xla is True:
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    return config
+
+
+def set_default_session(intra_op_threads=0, inter_op_threads=0):
+    K.set_session(tf.Session(config=get_session_config(intra_op_threads, inter_op_threads)))
+
+
+class KerasPredictor():
+    """Caches one inference model per length bucket and requested output set, and runs plain `model.predict` on it.
+
+    `model_builder(max_word_len)` must return the full model with its weights already loaded; models for a subset
+    of `cnn_rnn_with_context.OUTPUT_NAMES` share its layers and only compute the heads asked for. All models live
+    in a private graph and session so that the session config does not leak into the default Keras session.
+    """
+    def __init__(self, model_builder, batch_size=128, bucket_size=None, intra_op_threads=0, inter_op_threads=0,
+                 use_xla=False):
+        self.model_builder = model_builder
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.graph = tf.Graph()
+        self.session = tf.Session(graph=self.graph, config=get_session_config(intra_op_threads, inter_op_threads,
+                                                                              use_xla))
+        self.models = dict()
+        with self.graph.as_default():
+            K.set_learning_phase(0)
+
+    @staticmethod
+    def get_output_key(outputs):
+        if outputs is None or set(outputs) == set(cnn_rnn_with_context.OUTPUT_NAMES):
+            return None
+        return tuple(sorted(set(outputs), key=cnn_rnn_with_context.OUTPUT_NAMES.index))
+
+    def get_model(self, bucket_len, outputs=None):
+        output_key = self.get_output_key(outputs)
+        if (bucket_len, output_key) not in self.models:
+            with self.graph.as_default(), self.session.as_default():
+                if output_key is None:
+                    self.models[(bucket_len, None)] = self.model_builder(bucket_len)
+                else:
+                    self.models[(bucket_len, output_key)] = \
+                        cnn_rnn_with_context.select_outputs(self.get_model(bucket_len), output_key)
+        return self.models[(bucket_len, output_key)]
+
+    def select_inputs(self, inputs, bucket_len, outputs):
+        """Picks the requested model's inputs out of a list ordered like the full model's inputs (None if unused)."""
+        inputs_by_name = dict(zip(self.get_model(bucket_len).input_names, inputs))
+        return [inputs_by_name[name] for name in self.get_model(bucket_len, outputs).input_names]
+
+    def pad_inputs(self, inputs, bucket_len, outputs=None):
+        model = self.get_model(bucket_len, outputs)
+        padded_inputs = list()
+        for _input, model_input in zip(inputs, model.inputs):
+            if K.int_shape(model_input)[1] == bucket_len and _input.shape[1] < bucket_len:
+                _input = np.pad(_input, ((0, 0), (0, bucket_len - _input.shape[1])), mode='constant')
+            padded_inputs.append(_input)
+        return padded_inputs
+
+    @staticmethod
+    def trim_outputs(outputs, max_word_len):
+        return [each[:, :max_word_len, :] if each.ndim == 3 else each for each in outputs]
+
+    def run(self, inputs, bucket_len, outputs=None):
+        with self.graph.as_default(), self.session.as_default():
+            predictions = self.get_model(bucket_len, outputs).predict(inputs, batch_size=self.batch_size)
+        return predictions if isinstance(predictions, list) else [predictions]
+
+    def predict(self, inputs, outputs=None):
+        max_word_len = inputs[0].shape[1]
+        bucket_len = get_bucket_length(max_word_len, self.bucket_size)
+        inputs = self.select_inputs(inputs, bucket_len, outputs)
+        predictions = self.run(self.pad_inputs(inputs, bucket_len, outputs), bucket_len, outputs)
+        return self.trim_outputs(predictions, max_word_len)
+
+    def warm_up(self, word_lengths, outputs=None):
+        for bucket_len in sorted(set(get_bucket_length(each, self.bucket_size) for each in word_lengths)):
+            model = self.get_model(bucket_len, outputs)
+            dummy_inputs = [np.zeros((self.batch_size,) + K.int_shape(each)[1:], dtype='float32')
+                            for each in model.inputs]
+            _ = self.run(dummy_inputs, bucket_len, outputs)
+
+
+class CompiledPredictor(KerasPredictor):
+    """Runs each length bucket through a traced backend function whose ops are built inside an XLA jit scope, which
+    (unlike the session's global JIT level) also compiles them on CPU.
+
+    Every call is padded to exactly `batch_size` rows so that each bucket keeps a single fixed input signature
+    and XLA compiles it only once, during `warm_up`.
+    """
+    def __init__(self, model_builder, batch_size=128, bucket_size=None, intra_op_threads=0, inter_op_threads=0):
+        super().__init__(model_builder, batch_size=batch_size, bucket_size=bucket_size,
+                         intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads, use_xla=True)
+        self.functions = dict()
+
+    def get_model(self, bucket_len, outputs=None):
+        with self.graph.as_default(), jit.experimental_jit_scope():
+            return super().get_model(bucket_len, outputs)
+
+    def get_function(self, bucket_len, outputs=None):
+        key = (bucket_len, self.get_output_key(outputs))
+        if key not in self.functions:
+            model = self.get_model(bucket_len, outputs)
+            with self.graph.as_default(), self.session.as_default():
+                self.functions[key] = K.function(model.inputs, model.outputs)
+        return self.functions[key]
+
+    def run(self, inputs, bucket_len, outputs=None):
+        function = self.get_function(bucket_len, outputs)
+        num_samples = inputs[0].shape[0]
+        batch_outputs = list()
+        for start in range(0, num_samples, self.batch_size):
+            batch = [each[start:start + self.batch_size] for each in inputs]
+            num_rows = batch[0].shape[0]
+            if num_rows < self.batch_size:
+                batch = [np.pad(each, [(0, self.batch_size - num_rows)] + [(0, 0)] * (each.ndim - 1),
+                                mode='constant') for each in batch]
+            with self.graph.as_default(), self.session.as_default():
+                predictions = function(batch)
+            batch_outputs.append([each[:num_rows] for each in predictions])
+        return [np.concatenate(each, axis=0) for each in zip(*batch_outputs)]
+
+
+def time_predictions(predict_fn, inputs, batch_size, repeats=3):
+    num_samples = inputs[0].shape[0]
+    timings = list()
+    _ = predict_fn(inputs)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _ = predict_fn(inputs)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    num_batches = int(np.ceil(num_samples / batch_size))
+    return {'total_seconds': best, 'batch_latency_ms': 1000 * best / num_batches,
+            'words_per_second': num_samples / best}
+
+
+def compare_with_keras_predict(model, predictor, inputs, repeats=3, backend_name='xla', atol=1e-4):
+    """Checks that `predictor` gives the outputs of `model.predict` with `model` built for the inputs' exact word
+    length, then compares their latency and throughput."""
+    expected = model.predict(inputs, batch_size=predictor.batch_size)
+    expected = expected if isinstance(expected, list) else [expected]
+    max_differences = [float(np.max(np.abs(each - other))) for each, other in zip(expected, predictor.predict(inputs))]
+    assert all(difference <= atol for difference in max_differences), \
+        f"{backend_name} outputs differ from model.predict (max absolute difference per output: {max_differences})"
+    keras_stats = time_predictions(lambda x: model.predict(x, batch_size=predictor.batch_size), inputs,
+                                   predictor.batch_size, repeats=repeats)
+    compiled_stats = time_predictions(predictor.predict, inputs, predictor.batch_size, repeats=repeats)
+    print("Backend\t\tBatch latency (ms)\t\tWords/sec")
+    for name, stats in [('keras', keras_stats), (backend_name, compiled_stats)]:
+        print(f"{name}\t\t{stats['batch_latency_ms']:.2f}\t\t{stats['words_per_second']:.1f}")
+    print(f"Speedup: {keras_stats['total_seconds'] / compiled_stats['total_seconds']:.2f}x")
+    return keras_stats, compiled_stats
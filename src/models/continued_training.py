@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from src.models import cnn_rnn_with_context
+from src.processor import process_words
+
+LABEL_POLICIES = ['drop', 'map', 'extend']
+
+
+def get_unknown_labels(features, encoders):
+    return [sorted(set(head) - set(encoders[idx].classes_)) for idx, head in enumerate(features)]
+
+
+def apply_label_policy(words, roots, features, encoders, policy='drop', label_map=None):
+    """Makes every tag of new data known to the returned encoders; returns (words, roots, features, encoders).
+
+    drop: samples with any unseen tag are removed. map: unseen tags are replaced through `label_map`
+    ({output name: {new tag: known tag}}) and samples with unmapped ones are removed. extend: unseen tags become new
+    classes, re-sorted as LabelEncoder expects, so the matching output layers have to be grown.
+    """
+    unknown_labels = get_unknown_labels(features, encoders)
+    if policy == 'extend':
+        encoders = {idx: LabelEncoder().fit(np.concatenate([encoder.classes_, unknown_labels[idx]]))
+                    for idx, encoder in encoders.items()}
+        for idx, labels in enumerate(unknown_labels):
+            if len(labels) > 0:
+                print(f"Extending {cnn_rnn_with_context.OUTPUT_NAMES[idx + 1]} with {labels}")
+        return words, roots, features, encoders
+    if policy == 'map':
+        label_map = label_map or dict()
+        features = [[label_map.get(cnn_rnn_with_context.OUTPUT_NAMES[idx + 1], dict()).get(label, label)
+                     for label in head] for idx, head in enumerate(features)]
+    known = [set(encoders[idx].classes_) for idx in range(len(features))]
+    keep = [all(head[sample] in known[idx] for idx, head in enumerate(features)) for sample in range(len(words))]
+    print(f"Dropping {len(keep) - sum(keep)} of {len(keep)} new samples with unseen tags")
+    words, roots = [[each for each, flag in zip(values, keep) if flag] for values in [words, roots]]
+    features = [[label for label, flag in zip(head, keep) if flag] for head in features]
+    return words, roots, features, encoders
+
+
+def get_index_maps(old_encoders, new_encoders):
+    """Per tag head, the position of every old class in the new (possibly extended) class list."""
+    return [np.searchsorted(new_encoders[idx].classes_, old_encoders[idx].classes_) for idx in range(len(old_encoders))]
+
+
+def grow_output_weights(weights, index_map, num_classes):
+    """New classes start with zero incoming weights and the head's lowest bias, so they are initially unlikely."""
+    kernel, bias = weights
+    new_kernel = np.zeros((kernel.shape[0], num_classes), dtype=kernel.dtype)
+    new_bias = np.full(num_classes, bias.min(), dtype=bias.dtype)
+    new_kernel[:, index_map], new_bias[index_map] = kernel, bias
+    return [new_kernel, new_bias]
+
+
+def transfer_weights(old_model, new_model, index_maps):
+    """Warm-starts `new_model` from `old_model`, growing any output layer whose tag head was extended."""
+    for layer in old_model.layers:
+        weights = layer.get_weights()
+        if len(weights) == 0:
+            continue
+        new_layer = new_model.get_layer(layer.name)
+        if layer.name.startswith('output') and new_layer.units != layer.units:
+            weights = grow_output_weights(weights, index_maps[int(layer.name[len('output'):])], new_layer.units)
+        new_layer.set_weights(weights)
+
+
+def expand_predictions(predictions, index_maps, list_of_feature_nums):
+    """Lays an old model's tag probabilities out over the extended classes so both models are scored alike."""
+    expanded = predictions[:1]
+    for prediction, index_map, num_classes in zip(predictions[1:], index_maps, list_of_feature_nums):
+        expanded_prediction = np.zeros((prediction.shape[0], num_classes), dtype=prediction.dtype)
+        expanded_prediction[:, index_map] = prediction
+        expanded.append(expanded_prediction)
+    return expanded
+
+
+def pad_to_word_length(inputs, outputs, max_word_len, cw):
+    """Post-pads arrays built for shorter words to `max_word_len`, as if they had been padded to it in the first place.
+
+    The word and context inputs get the padding index, the decoder input is rebuilt from the padded word and the
+    padded root steps are one-hot on the padding index.
+    """
+    word_len = inputs[0].shape[1]
+    if word_len == max_word_len:
+        return inputs, outputs
+    def pad(array):
+        return np.pad(array, [(0, 0), (0, max_word_len - word_len)] + [(0, 0)] * (array.ndim - 2), mode='constant')
+    inputs = [pad(each) if idx < 2*cw + 1 else each for idx, each in enumerate(inputs)]
+    inputs[2*cw + 1] = process_words.get_decoder_input(inputs[0])
+    roots = pad(outputs[0])
+    roots[:, word_len:, 0] = 1
+    return inputs, [roots] + list(outputs[1:])
+
+
+def sample_replay(train_size, num_samples, seed=0):
+    return np.sort(np.random.RandomState(seed).choice(train_size, min(int(num_samples), train_size), replace=False))
+
+
+def print_drift(before, after):
+    print("Output\t\tBefore\t\tAfter\t\tDrift")
+    for name in cnn_rnn_with_context.OUTPUT_NAMES:
+        print(f"{name}\t\t{before[name]:.4f}\t\t{after[name]:.4f}\t\t{after[name] - before[name]:+.4f}")
+
+
+def get_candidate_path(weights_path):
+    root, ext = os.path.splitext(weights_path)
+    return root + '_continued' + ext
+
+
+def get_previous_path(weights_path):
+    root, ext = os.path.splitext(weights_path)
+    return root + '_previous' + ext
+
+
+def is_regression(before, after, max_accuracy_drop=0.0):
+    return any(after[name] - before[name] < -max_accuracy_drop for name in cnn_rnn_with_context.OUTPUT_NAMES)
+
+
+def promote_weights(candidate_path, weights_path):
+    """Moves the candidate weights into place, keeping the replaced ones next to them for a manual rollback."""
+    if os.path.exists(weights_path):
+        os.replace(weights_path, get_previous_path(weights_path))
+    os.replace(candidate_path, weights_path)
@@ -0,0 +1,209 @@
+import os
+import time
+from multiprocessing import get_context
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.callbacks import CallbackList
+
+from src.models import cnn_rnn_with_context, compiled_inference
+from src.processor import tensor_store
+
+
+def get_available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def get_default_num_workers(threads_per_worker):
+    return max(1, get_available_cores() // threads_per_worker)
+
+
+def _pin_worker(worker_idx, num_threads):
+    """Gives a worker its own `num_threads` cores (where the OS allows it) and a session sized to match."""
+    if hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        own_cores = cores[worker_idx*num_threads:(worker_idx + 1)*num_threads]
+        if len(own_cores) == num_threads:
+            os.sched_setaffinity(0, own_cores)
+        else:
+            print(f"Worker {worker_idx} is not pinned: only {len(cores)} cores for {num_threads} threads per worker")
+    K.set_session(tf.Session(config=compiled_inference.get_session_config(intra_op_threads=num_threads,
+                                                                          inter_op_threads=1)))
+
+
+def _worker_loop(worker_idx, num_workers, connection, store_dir, model_kwargs, batch_size, num_threads,
+                 num_samples=None):
+    """Trains a replica on every `num_workers`-th training example, one round at a time.
+
+    Each message is (weights, epoch, start, num_batches): the replica takes the parent's averaged weights, fits the
+    given batches of its shard (shuffled once per epoch) and sends back (weights, samples seen, mean loss).
+    """
+    _pin_worker(worker_idx, num_threads)
+    inputs, outputs, meta = tensor_store.TensorStore(store_dir).read()
+    shard = np.arange(worker_idx, num_samples or meta['train_size'], num_workers)
+    shard_inputs, shard_outputs = [[np.asarray(each[shard]) for each in arrays] for arrays in [inputs, outputs]]
+    model = cnn_rnn_with_context.MorphAnalyzerModels(**model_kwargs).create_and_compile_model(freezer=False)
+    connection.send(len(shard)) # ready
+    order, order_epoch = None, None
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        weights, epoch, start, num_batches = message
+        if order_epoch != epoch:
+            order, order_epoch = np.random.RandomState(epoch*num_workers + worker_idx).permutation(len(shard)), epoch
+        batch_indices = order[start*batch_size:(start + num_batches)*batch_size]
+        if len(batch_indices) == 0:
+            connection.send((weights, 0, 0.0))
+            continue
+        model.set_weights(weights)
+        hist = model.fit([each[batch_indices] for each in shard_inputs],
+                         [each[batch_indices] for each in shard_outputs], batch_size=batch_size, epochs=1,
+                         shuffle=False, verbose=0)
+        connection.send((model.get_weights(), len(batch_indices), hist.history['loss'][-1]))
+    connection.close()
+
+
+def average_weights(weight_lists, sample_counts):
+    total = float(sum(sample_counts))
+    return [sum(weights[idx] * (count / total) for weights, count in zip(weight_lists, sample_counts))
+            for idx in range(len(weight_lists[0]))]
+
+
+class DataParallelTrainer():
+    """Synchronous data-parallel training of one model by parameter averaging across local worker processes.
+
+    Every round, each worker starts from the parent's weights, fits `sync_batches` batches of its own shard of the
+    training set read from a TensorStore, and the parent sets its model to the sample-weighted average of the
+    returned weights (optimizer state stays local to each worker). Validation and callbacks run in the parent, so
+    `EarlyStopping` and `ModelCheckpoint` behave as with `model.fit`.
+    """
+    def __init__(self, model, model_kwargs, store_dir, num_workers, threads_per_worker=1, batch_size=128,
+                 sync_batches=None, num_samples=None):
+        self.model = model
+        self.model_kwargs = model_kwargs
+        self.store_dir = store_dir
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.batch_size = batch_size
+        self.train_size = num_samples or tensor_store.TensorStore(store_dir).read_manifest()['train_size']
+        self.shard_batches = int(np.ceil(np.ceil(self.train_size / num_workers) / batch_size))
+        self.sync_batches = sync_batches or self.shard_batches
+        self.num_samples = num_samples
+        self.connections = list()
+        self.processes = list()
+
+    def start(self):
+        if self.num_workers * self.threads_per_worker > get_available_cores():
+            print(f"{self.num_workers} workers x {self.threads_per_worker} threads oversubscribe the "
+                  f"{get_available_cores()} available cores")
+        context = get_context('spawn')
+        # spawned workers import TF before any of their own code runs, so the thread count has to be in the
+        # environment they start with
+        omp_num_threads = os.environ.get('OMP_NUM_THREADS')
+        os.environ['OMP_NUM_THREADS'] = str(self.threads_per_worker)
+        try:
+            for worker_idx in range(self.num_workers):
+                parent_connection, child_connection = context.Pipe()
+                process = context.Process(target=_worker_loop, args=(worker_idx, self.num_workers, child_connection,
+                                                                     self.store_dir, self.model_kwargs,
+                                                                     self.batch_size, self.threads_per_worker,
+                                                                     self.num_samples))
+                process.start()
+                self.connections.append(parent_connection)
+                self.processes.append(process)
+        finally:
+            if omp_num_threads is None:
+                os.environ.pop('OMP_NUM_THREADS')
+            else:
+                os.environ['OMP_NUM_THREADS'] = omp_num_threads
+        _ = [connection.recv() for connection in self.connections]
+
+    def stop(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        self.connections, self.processes = list(), list()
+
+    def train_epoch(self, epoch):
+        losses, total_samples = list(), 0
+        for start in range(0, self.shard_batches, self.sync_batches):
+            weights = self.model.get_weights()
+            for connection in self.connections:
+                connection.send((weights, epoch, start, self.sync_batches))
+            results = [connection.recv() for connection in self.connections]
+            results = [result for result in results if result[1] > 0]
+            self.model.set_weights(average_weights([result[0] for result in results],
+                                                   [result[1] for result in results]))
+            losses += [result[2] * result[1] for result in results]
+            total_samples += sum(result[1] for result in results)
+        return sum(losses) / max(total_samples, 1)
+
+    def fit(self, val_inputs, val_outputs, epochs, callbacks=None):
+        callback_list = CallbackList(callbacks or list())
+        callback_list.set_model(self.model)
+        self.model.stop_training = False
+        history = dict()
+        callback_list.on_train_begin()
+        for epoch in range(epochs):
+            callback_list.on_epoch_begin(epoch)
+            start = time.perf_counter()
+            logs = {'loss': self.train_epoch(epoch)}
+            val_metrics = self.model.evaluate(val_inputs, val_outputs, batch_size=self.batch_size, verbose=0)
+            logs.update({'val_' + name: value for name, value in zip(self.model.metrics_names, val_metrics)})
+            print(f"Epoch {epoch + 1}/{epochs} ({time.perf_counter() - start:.1f}s): loss {logs['loss']:.4f}, "
+                  f"val_loss {logs['val_loss']:.4f}")
+            callback_list.on_epoch_end(epoch, logs)
+            for key, value in logs.items():
+                history.setdefault(key, list()).append(value)
+            if self.model.stop_training:
+                break
+        callback_list.on_train_end()
+        return history
+
+
+def measure_scaling(model, model_kwargs, store_dir, worker_counts, threads_per_worker=1, batch_size=128,
+                    sync_batches=None, num_samples=None):
+    """Times one training epoch over the same `num_samples` examples for each worker count, averaging weights every
+    `sync_batches` batches as in training.
+
+    Efficiency is the throughput with N workers divided by N times the single-worker throughput. Process start-up and
+    model building are not timed.
+    """
+    initial_weights = model.get_weights()
+    results = list()
+    for num_workers in worker_counts:
+        model.set_weights(initial_weights)
+        trainer = DataParallelTrainer(model, model_kwargs, store_dir, num_workers,
+                                      threads_per_worker=threads_per_worker, batch_size=batch_size,
+                                      sync_batches=sync_batches, num_samples=num_samples)
+        trainer.start()
+        try:
+            start = time.perf_counter()
+            _ = trainer.train_epoch(0)
+            seconds = time.perf_counter() - start
+        finally:
+            trainer.stop()
+        results.append({'workers': num_workers, 'seconds': seconds, 'samples_per_second': trainer.train_size / seconds})
+    for result in results:
+        result['speedup'] = result['samples_per_second'] / results[0]['samples_per_second']
+        result['efficiency'] = result['speedup'] * results[0]['workers'] / result['workers']
+    model.set_weights(initial_weights)
+    return results
+
+
+def get_worker_counts(max_workers):
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    return counts + [max_workers] if max_workers > 1 else counts
+
+
+def write_scaling_report(results, output_path):
+    columns = ['workers', 'seconds', 'samples_per_second', 'speedup', 'efficiency']
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(columns) + '\n')
+        for result in results:
+            f.write('\t'.join(str(result[column]) for column in columns) + '\n')
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+
+from src import handle_pickles
+from src.models import cnn_rnn_with_context, compiled_inference
+
+EXPORT_FORMAT_VERSION = 3
+
+
+def get_resource_dir(export_dir):
+    return os.path.join(export_dir, 'resources')
+
+
+def read_manifest(export_dir):
+    with open(os.path.join(export_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != EXPORT_FORMAT_VERSION:
+        raise ValueError("Unsupported export format in " + export_dir)
+    return manifest
+
+
+def get_weights_version(weights_path):
+    """Size and modification time of the weights an export was frozen from, or None if they are not there."""
+    if not os.path.exists(weights_path):
+        return None
+    stat = os.stat(weights_path)
+    return str(stat.st_size) + ':' + str(stat.st_mtime_ns)
+
+
+def check_weights_version(manifest, weights_version):
+    if weights_version is not None and weights_version != manifest['weights_version']:
+        raise ValueError(f"The {manifest['variant']} weights changed since they were exported; run the export mode "
+                         f"again")
+
+
+def check_vocab_version(manifest, vocab_version):
+    """Fails if the vocab and encoders an export was made with are not the ones `vocab_version` was computed from
+    (None, for resources that are not there, is accepted)."""
+    if vocab_version is not None and vocab_version != manifest['vocab_version']:
+        raise ValueError(f"The {manifest['variant']} export was made with another vocab or label encoders "
+                         f"(version {manifest['vocab_version']}, now {vocab_version}); run the export mode again")
+
+
+def freeze_model(model_builder, word_len):
+    """Builds the inference model for one word length in a throwaway graph and folds its weights into constants.
+
+    Returns the frozen GraphDef, pruned down to what the outputs need, and the names and shapes of its endpoints.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        session = tf.Session(graph=graph)
+        with session.as_default():
+            K.set_learning_phase(0)
+            model = model_builder(word_len)
+            graph_def = tf.graph_util.convert_variables_to_constants(session, graph.as_graph_def(),
+                                                                     [tensor.op.name for tensor in model.outputs])
+            signature = {'inputs': [tensor.name for tensor in model.inputs],
+                         'input_shapes': [list(K.int_shape(tensor)[1:]) for tensor in model.inputs],
+                         'outputs': [tensor.name for tensor in model.outputs]}
+            input_names = model.input_names
+        session.close()
+    return graph_def, signature, input_names
+
+
+def export_variant(model_builder, export_dir, word_lengths, resource_names, vocab_resource_names, metadata=None):
+    """Writes one frozen `.pb` graph per word length, the vocab/encoder/label pickles and a manifest to `export_dir`.
+
+    Words are never padded past the batch's longest one: the GRU encoder is unmasked and the attention covers every
+    step, so padding changes the outputs. The manifest's `vocab_version` is the hash of the bundled
+    `vocab_resource_names`, the pickles the graphs' input indices and output classes depend on.
+    """
+    os.makedirs(get_resource_dir(export_dir), exist_ok=True)
+    lengths = dict()
+    for word_len in word_lengths:
+        graph_def, signature, input_names = freeze_model(model_builder, word_len)
+        graph_filename = 'length_' + str(word_len) + '.pb'
+        with open(os.path.join(export_dir, graph_filename), 'wb') as f:
+            f.write(graph_def.SerializeToString())
+        lengths[str(word_len)] = dict(signature, graph=graph_filename)
+    for name in resource_names:
+        shutil.copy(handle_pickles.PickleHandler().get_path(name), get_resource_dir(export_dir))
+    vocab_version = handle_pickles.PickleHandler(get_resource_dir(export_dir)).get_version(vocab_resource_names)
+    manifest = dict(metadata or dict(), format_version=EXPORT_FORMAT_VERSION, input_names=input_names,
+                    output_names=cnn_rnn_with_context.OUTPUT_NAMES, lengths=lengths, resources=resource_names,
+                    vocab_resources=vocab_resource_names, vocab_version=vocab_version)
+    with open(os.path.join(export_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class FrozenGraphPredictor():
+    """Serves a variant exported by `export_variant` by importing its frozen graphs; no Keras model is built.
+
+    Takes and returns the same lists as `KerasPredictor.predict`. A batch goes to the graph exported for exactly its
+    longest word's length, so it gives the outputs of the Keras model, and only the inputs the requested outputs
+    depend on are fed.
+    """
+    def __init__(self, export_dir, batch_size=128, intra_op_threads=0, inter_op_threads=0, use_xla=False):
+        self.export_dir = export_dir
+        self.batch_size = batch_size
+        self.manifest = read_manifest(export_dir)
+        # the bundled pickles must still be the ones the graphs were exported with
+        self.pickle_handler = handle_pickles.PickleHandler(get_resource_dir(export_dir))
+        vocab_version = self.pickle_handler.get_version(self.manifest['vocab_resources'])
+        if vocab_version is None:
+            raise ValueError("Bundled vocab or encoders missing from " + get_resource_dir(export_dir))
+        check_vocab_version(self.manifest, vocab_version)
+        self.word_lengths = sorted(int(key) for key in self.manifest['lengths'])
+        self.graph = tf.Graph()
+        self.session = tf.Session(graph=self.graph, config=compiled_inference.get_session_config(intra_op_threads,
+                                                                                                  inter_op_threads,
+                                                                                                  use_xla))
+        self.tensors = dict()
+
+    def get_length_manifest(self, word_len):
+        if str(word_len) not in self.manifest['lengths']:
+            raise ValueError(f"No graph exported for words of length {word_len} (exported: {self.word_lengths[0]} to "
+                             f"{self.word_lengths[-1]}); raise EXPORT.MAX_WORD_LEN and run the export mode again")
+        return self.manifest['lengths'][str(word_len)]
+
+    def load_length(self, word_len):
+        if word_len not in self.tensors:
+            length_manifest = self.get_length_manifest(word_len)
+            graph_def = tf.GraphDef()
+            with open(os.path.join(self.export_dir, length_manifest['graph']), 'rb') as f:
+                graph_def.ParseFromString(f.read())
+            scope = 'length_' + str(word_len)
+            with self.graph.as_default():
+                tf.import_graph_def(graph_def, name=scope)
+            self.tensors[word_len] = [[self.graph.get_tensor_by_name(scope + '/' + name)
+                                       for name in length_manifest[key]] for key in ['inputs', 'outputs']]
+        return self.tensors[word_len]
+
+    def predict(self, inputs, outputs=None):
+        outputs = sorted(outputs or cnn_rnn_with_context.OUTPUT_NAMES, key=cnn_rnn_with_context.OUTPUT_NAMES.index)
+        input_tensors, output_tensors = self.load_length(inputs[0].shape[1])
+        input_names = self.manifest['input_names']
+        required_names = cnn_rnn_with_context.get_required_input_names(input_names, outputs)
+        feeds = [(tensor, _input) for name, tensor, _input in zip(input_names, input_tensors, inputs)
+                 if name in required_names]
+        fetches = [output_tensors[cnn_rnn_with_context.OUTPUT_NAMES.index(output)] for output in outputs]
+        batch_outputs = list()
+        for start in range(0, inputs[0].shape[0], self.batch_size):
+            feed_dict = {tensor: _input[start:start + self.batch_size] for tensor, _input in feeds}
+            batch_outputs.append(self.session.run(fetches, feed_dict=feed_dict))
+        return [np.concatenate(each, axis=0) for each in zip(*batch_outputs)]
+
+    def warm_up(self, word_lengths, outputs=None):
+        for word_len in sorted(set(word_lengths)):
+            dummy_inputs = [np.zeros([self.batch_size] + shape, dtype='float32')
+                            for shape in self.get_length_manifest(word_len)['input_shapes']]
+            _ = self.predict(dummy_inputs, outputs=outputs)
+
+
+def get_random_inputs(input_shapes, vocab_len, num_words=128, seed=0):
+    """Random char indices for the word inputs and small counts for the phonetic ones, given (name, shape) pairs."""
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, vocab_len if name.startswith('input_') else 3, size=[num_words] + shape).astype('float32')
+            for name, shape in input_shapes]
+
+
+def check_export(model_builder, export_dir, word_len, vocab_len, batch_size=128, atol=1e-4):
+    """Asserts the frozen graph for `word_len` gives the outputs of the Keras model on random inputs."""
+    manifest = read_manifest(export_dir)
+    inputs = get_random_inputs(list(zip(manifest['input_names'], manifest['lengths'][str(word_len)]['input_shapes'])),
+                               vocab_len, num_words=batch_size)
+    predictor = FrozenGraphPredictor(export_dir, batch_size=batch_size)
+    try:
+        return compiled_inference.compare_with_keras_predict(model_builder(word_len), predictor, inputs, repeats=1,
+                                                             backend_name='frozen', atol=atol)
+    finally:
+        predictor.session.close()
+
+
+def benchmark_cold_start(model_builder, export_dir, word_len, batch_size=128, repeats=3):
+    """Seconds from nothing loaded to the first batch predicted: building the Keras model and loading its HDF5
+    weights, against importing the exported frozen graph. The best of `repeats` fresh predictors is kept."""
+    input_shapes = read_manifest(export_dir)['lengths'][str(word_len)]['input_shapes']
+    inputs = [np.zeros([batch_size] + shape, dtype='float32') for shape in input_shapes]
+    timings = {'keras': list(), 'frozen': list()}
+    for _ in range(repeats):
+        for name, predictor_factory in [('keras', lambda: compiled_inference.KerasPredictor(model_builder,
+                                                                                             batch_size=batch_size)),
+                                        ('frozen', lambda: FrozenGraphPredictor(export_dir, batch_size=batch_size))]:
+            start = time.perf_counter()
+            predictor = predictor_factory()
+            _ = predictor.predict(inputs)
+            timings[name].append(time.perf_counter() - start)
+            predictor.session.close()
+    return {name: min(values) for name, values in timings.items()}
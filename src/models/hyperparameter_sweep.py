@@ -0,0 +1,108 @@
+import itertools
+import os
+import random
+import time
+from functools import partial
+from multiprocessing import get_context
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.callbacks import EarlyStopping
+
+from src.models import cnn_rnn_with_context, compiled_inference
+from src.processor import tensor_store
+
+SWEEP_KEYS = ['num_filters', 'filter_len', 'rnn_output_size', 'dropout_rate', 'CONTEXT_WINDOW']
+
+
+def get_trials(sweep_params, seed=0):
+    grid = [dict(zip(SWEEP_KEYS, values)) for values in itertools.product(*[sweep_params[key] for key in SWEEP_KEYS])]
+    num_trials = sweep_params.get('TRIALS')
+    if num_trials and num_trials < len(grid):
+        grid = random.Random(seed).sample(grid, num_trials)
+    return grid
+
+
+def select_context_inputs(inputs, stored_cw, trial_cw):
+    """Keeps the first `trial_cw` left and right shifted inputs out of the `stored_cw` ones that were preprocessed."""
+    left_inputs = inputs[1:1 + stored_cw][:trial_cw]
+    right_inputs = inputs[1 + stored_cw:1 + 2*stored_cw][:trial_cw]
+    return inputs[:1] + left_inputs + right_inputs + inputs[1 + 2*stored_cw:]
+
+
+def _init_worker(num_threads):
+    K.set_session(tf.Session(config=compiled_inference.get_session_config(intra_op_threads=num_threads,
+                                                                          inter_op_threads=1)))
+
+
+def run_trial(trial, store_dir, model_params, sweep_params):
+    inputs, outputs, meta = tensor_store.TensorStore(store_dir).read()
+    inputs = select_context_inputs(inputs, meta['context_window'], trial['CONTEXT_WINDOW'])
+    train_size = meta['train_size']
+    train_inputs, val_inputs = [each[:train_size] for each in inputs], [each[train_size:] for each in inputs]
+    train_outputs, val_outputs = [each[:train_size] for each in outputs], [each[train_size:] for each in outputs]
+
+    model_instance = cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=meta['max_word_len'],
+                                                              vocab_len=meta['vocab_len'],
+                                                              embedding_dim=model_params['EMBED_DIM'],
+                                                              list_of_feature_nums=meta['n'],
+                                                              cw=trial['CONTEXT_WINDOW'],
+                                                              use_phonetic_features=meta['phonetic'],
+                                                              phonetic_dims=meta['phonetic_dims'],
+                                                              num_filters=trial['num_filters'],
+                                                              filter_len=trial['filter_len'],
+                                                              rnn_output_size=trial['rnn_output_size'],
+                                                              dropout_rate=trial['dropout_rate'])
+    model = model_instance.create_and_compile_model(freezer=False)
+    start = time.perf_counter()
+    hist = model.fit(train_inputs, train_outputs, validation_data=(val_inputs, val_outputs),
+                     batch_size=model_params['BATCH_SIZE'], epochs=sweep_params['EPOCHS'], verbose=0,
+                     callbacks=[EarlyStopping(patience=sweep_params['PATIENCE'])])
+    train_seconds = time.perf_counter() - start
+
+    best_epoch = int(np.argmin(hist.history['val_loss']))
+    accuracy_keys = [key for key in hist.history if key.startswith('val_') and key.endswith('acc')]
+    val_accuracy = float(np.mean([hist.history[key][best_epoch] for key in accuracy_keys]))
+
+    cost_inputs = [np.asarray(each[:sweep_params['COST_SAMPLES']]) for each in val_inputs]
+    _ = model.predict(cost_inputs, batch_size=model_params['BATCH_SIZE'])
+    start = time.perf_counter()
+    _ = model.predict(cost_inputs, batch_size=model_params['BATCH_SIZE'])
+    ms_per_1k_words = 1e6 * (time.perf_counter() - start) / cost_inputs[0].shape[0]
+
+    result = dict(trial)
+    result.update({'val_accuracy': val_accuracy, 'ms_per_1k_words': ms_per_1k_words,
+                   'score': val_accuracy / ms_per_1k_words, 'params': model.count_params(),
+                   'epochs': len(hist.history['val_loss']), 'train_seconds': train_seconds})
+    return result
+
+
+def run_sweep(trials, store_dir, model_params, sweep_params):
+    context = get_context('spawn')
+    trial_runner = partial(run_trial, store_dir=store_dir, model_params=model_params, sweep_params=sweep_params)
+    results = list()
+    # spawned workers import TF before the initializer runs, so the thread count has to be in the environment they
+    # start with; it stays set while the pool runs as every trial gets a fresh worker (maxtasksperchild=1)
+    omp_num_threads = os.environ.get('OMP_NUM_THREADS')
+    os.environ['OMP_NUM_THREADS'] = str(sweep_params['THREADS_PER_WORKER'])
+    try:
+        with context.Pool(processes=sweep_params['WORKERS'], initializer=_init_worker,
+                          initargs=(sweep_params['THREADS_PER_WORKER'],), maxtasksperchild=1) as pool:
+            for result in pool.imap_unordered(trial_runner, trials):
+                print(f"Trial {len(results) + 1}/{len(trials)}: {result}")
+                results.append(result)
+    finally:
+        if omp_num_threads is None:
+            os.environ.pop('OMP_NUM_THREADS')
+        else:
+            os.environ['OMP_NUM_THREADS'] = omp_num_threads
+    return sorted(results, key=lambda result: result['score'], reverse=True)
+
+
+def write_results(results, output_path):
+    columns = SWEEP_KEYS + ['val_accuracy', 'ms_per_1k_words', 'score', 'params', 'epochs', 'train_seconds']
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(['rank'] + columns) + '\n')
+        for rank, result in enumerate(results, 1):
+            f.write('\t'.join([str(rank)] + [str(result[column]) for column in columns]) + '\n')
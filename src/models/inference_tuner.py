@@ -0,0 +1,100 @@
+import itertools
+import os
+import socket
+import time
+
+import numpy as np
+import yaml
+
+PROFILE_KEYS = ['BATCH_SIZE', 'INTRA_OP_THREADS', 'INTER_OP_THREADS']
+
+
+def get_profile_path(profile_dir):
+    """One YAML file per host; it is machine specific, so `profile_dir` should not be under version control."""
+    return os.path.join(profile_dir, 'inference_profile_' + socket.gethostname() + '.yaml')
+
+
+def read_profiles(profile_dir):
+    profile_path = get_profile_path(profile_dir)
+    if not os.path.exists(profile_path):
+        return dict()
+    with open(profile_path, 'r') as stream:
+        profiles = yaml.safe_load(stream)
+    return profiles or dict()
+
+
+def read_profile(profile_dir, model_name, backend):
+    """This host's tuned settings for serving `model_name` (language, phonetic and frozen variant) with `backend`, or
+    an empty dict if that was never tuned here."""
+    return read_profiles(profile_dir).get(model_name, dict()).get(backend, dict())
+
+
+def write_profile(profile_dir, model_name, backend, result):
+    profiles = read_profiles(profile_dir)
+    profiles.setdefault(model_name, dict())[backend] = dict(result, CPU_COUNT=os.cpu_count(),
+                                                            TUNED_AT=time.strftime('%Y-%m-%d %H:%M:%S'))
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(get_profile_path(profile_dir), 'w') as stream:
+        yaml.safe_dump(profiles, stream, default_flow_style=False)
+
+
+def get_configs(tuner_params):
+    """Grid of settings to try; thread counts are capped at this host's core count (0 is TF's default).
+
+    Only settings that leave the outputs unchanged are tuned: padding words to a length bucket changes them (the GRU
+    encoder is unmasked and the attention covers the padding), so words always run at their exact length.
+    """
+    cpu_count = os.cpu_count() or 1
+    intra_op_threads = sorted(set(min(each, cpu_count) for each in tuner_params['INTRA_OP_THREADS']))
+    inter_op_threads = sorted(set(min(each, cpu_count) for each in tuner_params['INTER_OP_THREADS']))
+    return [dict(zip(PROFILE_KEYS, values)) for values in itertools.product(tuner_params['BATCH_SIZES'],
+                                                                             intra_op_threads, inter_op_threads)]
+
+
+def measure(predictor, batches):
+    """Runs every batch once to build and warm the per-length models, then times a second pass batch by batch."""
+    for batch in batches:
+        _ = predictor.predict(batch)
+    latencies = list()
+    for batch in batches:
+        start = time.perf_counter()
+        _ = predictor.predict(batch)
+        latencies.append(time.perf_counter() - start)
+    num_tokens = sum(batch[0].shape[0] for batch in batches)
+    return {'tokens_per_second': num_tokens / sum(latencies), 'p95_ms': 1000 * float(np.percentile(latencies, 95)),
+            'mean_ms': 1000 * float(np.mean(latencies))}
+
+
+def tune(predictor_factory, prepare_batch, words, configs, latency_budget_ms=None):
+    """Measures each config on `words` split into its batch size (each batch padded on its own, as in serving).
+
+    Returns all results sorted best first: highest tokens/sec among the configs whose p95 batch latency is within
+    `latency_budget_ms`, then the rest by latency.
+    """
+    batches_by_size = dict()
+    results = list()
+    for idx, config in enumerate(configs):
+        batch_size = config['BATCH_SIZE']
+        if batch_size not in batches_by_size:
+            batches_by_size[batch_size] = [prepare_batch(words[start:start + batch_size])
+                                           for start in range(0, len(words), batch_size)]
+        predictor = predictor_factory(config)
+        try:
+            result = dict(config, **measure(predictor, batches_by_size[batch_size]))
+        finally:
+            predictor.session.close()
+        print(f"Config {idx + 1}/{len(configs)}: {result}")
+        results.append(result)
+    within_budget = [result for result in results if latency_budget_ms is None or
+                     result['p95_ms'] <= latency_budget_ms]
+    over_budget = [result for result in results if result not in within_budget]
+    return sorted(within_budget, key=lambda result: result['tokens_per_second'], reverse=True) + \
+        sorted(over_budget, key=lambda result: result['p95_ms'])
+
+
+def write_results(results, output_path):
+    columns = PROFILE_KEYS + ['tokens_per_second', 'p95_ms', 'mean_ms']
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(['rank'] + columns) + '\n')
+        for rank, result in enumerate(results, 1):
+            f.write('\t'.join([str(rank)] + [str(result[column]) for column in columns]) + '\n')
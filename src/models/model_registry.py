@@ -0,0 +1,198 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+
+from src import extract_phonetic_features, handle_pickles
+from src.models import cnn_rnn_with_context, compiled_inference, graph_export, pruning
+from src.processor import decode_outputs, process_words
+
+pickle_handler = handle_pickles.PickleHandler()
+VOCAB_RESOURCES = ['index_to_char_mapping', 'dict_of_encoders', 'num_of_indiv_features']
+
+Variant = namedtuple('Variant', ['lang', 'phonetic', 'freezing'])
+
+
+def get_weights_path(paths, lang, phonetic=False, freezing=False):
+    if phonetic is True and freezing is True:
+        key = 4
+    elif phonetic is False and freezing is True:
+        key = 3
+    elif phonetic is True and freezing is False:
+        key = 2
+    else:
+        key = 1
+    return paths['model_weights'][key]+'_'+lang+'.hdf5'
+
+
+def get_variant_name(variant):
+    return '-'.join([variant.lang, 'phonetic' if variant.phonetic else 'plain',
+                     'frozen' if variant.freezing else 'unfrozen'])
+
+
+def get_export_name(variant, in_graph_phonetic=False):
+    """Exports of phonetic variants that compute their features in-graph take different inputs, so they are kept
+    apart from the ones fed precomputed features."""
+    name = get_variant_name(variant)
+    return name + '-in_graph' if in_graph_phonetic is True and variant.phonetic is True else name
+
+
+def parse_variant(name):
+    parts = name.strip().split('-')
+    if len(parts) != 3 or parts[1] not in ['phonetic', 'plain'] or parts[2] not in ['frozen', 'unfrozen']:
+        raise ValueError("Variants look like '<lang>-<phonetic|plain>-<frozen|unfrozen>', got: " + name)
+    lang, phonetic, freezing = parts
+    return Variant(lang, phonetic == 'phonetic', freezing == 'frozen')
+
+
+def prepare_inputs(words, lang, vocab_size, cw, use_phonetic_features=False):
+    """Builds the full list of model inputs for a flat list of words once, for every variant of `lang`.
+
+    Models without phonetic inputs simply ignore the trailing phonetic arrays.
+    """
+    words_reversed = [item[::-1] for item in words]
+    X_indexed = process_words.get_indexed_words(words_reversed, mode='use_vocab', vocab_size=vocab_size, lang=lang)
+    input_shifter = process_words.ShiftWordsPerCW(X=words_reversed, cw=cw, vocab_size=vocab_size, lang=lang)
+    X_indexed_left, X_indexed_right = input_shifter.shift_input()
+    padded_indexed_inputs, max_word_len = process_words.pad_all_sequences([X_indexed] + X_indexed_left +
+                                                                          X_indexed_right)
+    padded_indexed_inputs.append(process_words.get_decoder_input(padded_indexed_inputs[0]))
+    if use_phonetic_features is True:
+        features = extract_phonetic_features.PhoneticFeatures(words).get_features()
+        padded_indexed_inputs += extract_phonetic_features.group_features_by_tag(features)
+    return padded_indexed_inputs
+
+
+def get_graph_bytes(graph):
+    """Bytes of every variable and constant in `graph`, whatever their dtype: the weights of Keras models and the
+    frozen weights and lookup tables that graph exports carry as constants."""
+    num_bytes = 0
+    for op in graph.get_operations():
+        if op.type in ['Const', 'VariableV2', 'VarHandleOp']:
+            dtype = tf.as_dtype(op.get_attr('dtype'))
+            shape = tf.TensorShape(op.get_attr('value').tensor_shape if op.type == 'Const' else op.get_attr('shape'))
+            num_bytes += (shape.num_elements() or 0) * dtype.size
+    return num_bytes
+
+
+class ModelRegistry():
+    """Serves several trained variants (language, phonetic, frozen) from one process.
+
+    Variants are registered up front and their weights are only loaded on first use. Vocab and label encoders are
+    loaded once per language and shared by every variant of it, the vocab also with the word indexing of
+    `prepare_inputs`. At most `max_loaded` variants stay in memory, and
+    `unload_idle` drops the ones not used for `idle_seconds`, least recently used first.
+    """
+    def __init__(self, paths, embed_dim, vocab_size, cw, batch_size=128, max_loaded=None, idle_seconds=None,
+                 backend='keras', in_graph_phonetic=False):
+        self.paths = paths
+        self.embed_dim = embed_dim
+        self.vocab_size = vocab_size
+        self.cw = cw
+        self.batch_size = batch_size
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.backend = backend
+        self.in_graph_phonetic = in_graph_phonetic
+        self.variants = dict()
+        self.predictors = dict()
+        self.last_used = dict()
+        self.resources = dict()
+
+    def register(self, variant):
+        self.variants[get_variant_name(variant)] = variant
+        return get_variant_name(variant)
+
+    def get_resources(self, lang):
+        if lang not in self.resources:
+            self.resources[lang] = {name: process_words.load_vocab(lang=lang) if name == 'index_to_char_mapping'
+                                    else pickle_handler.pickle_loader(name+'_'+lang) for name in VOCAB_RESOURCES}
+        return self.resources[lang]
+
+    def get_model_builder(self, variant):
+        n = self.get_resources(variant.lang)['num_of_indiv_features']
+        phonetic_dims = extract_phonetic_features.get_phonetic_feature_nums() if variant.phonetic else None
+        weights_path = get_weights_path(self.paths, variant.lang, variant.phonetic, variant.freezing)
+        architecture = pruning.read_architecture(weights_path)
+        phonetic_tables = None
+        if variant.phonetic is True and self.in_graph_phonetic is True:
+            phonetic_tables = extract_phonetic_features.get_char_feature_tables(
+                self.get_resources(variant.lang)['index_to_char_mapping'], vocab_len=self.vocab_size+2)[:len(n)]
+
+        def model_builder(max_word_len):
+            model_instance = cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=max_word_len,
+                                                                      vocab_len=self.vocab_size+2,
+                                                                      embedding_dim=self.embed_dim,
+                                                                      list_of_feature_nums=n, cw=self.cw,
+                                                                      use_phonetic_features=variant.phonetic,
+                                                                      phonetic_dims=phonetic_dims,
+                                                                      phonetic_tables=phonetic_tables, **architecture)
+            model = model_instance.cnn_rnn()
+            model.load_weights(weights_path)
+            return model
+        return model_builder
+
+    def get_predictor(self, name):
+        if name not in self.predictors:
+            if self.max_loaded is not None:
+                while len(self.predictors) >= self.max_loaded:
+                    self.unload(min(self.predictors, key=self.last_used.get))
+            if self.backend == 'frozen':
+                variant = self.variants[name]
+                predictor = graph_export.FrozenGraphPredictor(self.paths.get('export_dir', 'exports/') +
+                                                              get_export_name(variant, self.in_graph_phonetic),
+                                                              batch_size=self.batch_size)
+                graph_export.check_vocab_version(predictor.manifest, pickle_handler.get_version(
+                    [resource+'_'+variant.lang for resource in VOCAB_RESOURCES]))
+                graph_export.check_weights_version(predictor.manifest, graph_export.get_weights_version(
+                    get_weights_path(self.paths, variant.lang, variant.phonetic, variant.freezing)))
+                self.predictors[name] = predictor
+            else:
+                predictor_class = compiled_inference.CompiledPredictor if self.backend == 'xla' \
+                    else compiled_inference.KerasPredictor
+                self.predictors[name] = predictor_class(self.get_model_builder(self.variants[name]),
+                                                        batch_size=self.batch_size)
+        self.last_used[name] = time.time()
+        return self.predictors[name]
+
+    def unload(self, name):
+        predictor = self.predictors.pop(name, None)
+        if predictor is not None:
+            predictor.session.close()
+        self.last_used.pop(name, None)
+
+    def unload_idle(self):
+        if self.idle_seconds is None:
+            return
+        now = time.time()
+        for name in [name for name, last_used in self.last_used.items() if now - last_used > self.idle_seconds]:
+            self.unload(name)
+
+    def get_memory_usage(self):
+        """Bytes of weights and constants held in each loaded variant's graph, over all its length buckets."""
+        return {name: get_graph_bytes(predictor.graph)
+                for name, predictor in self.predictors.items()}
+
+    def predict(self, name, inputs, outputs=None):
+        return self.get_predictor(name).predict(inputs, outputs=outputs)
+
+    def predict_all(self, inputs, names, outputs=None):
+        """Fans the same preprocessed `inputs` out to every variant in `names`; returns {name: (outputs, secs)}."""
+        results = dict()
+        for name in names:
+            start = time.perf_counter()
+            predictions = self.predict(name, inputs, outputs=outputs)
+            results[name] = (predictions, time.perf_counter() - start)
+        return results
+
+
+def get_accuracies(predictions, gold_roots, gold_features, idx_to_char, encoders):
+    """Root exact-match accuracy and per-tag accuracy of one variant's full set of outputs."""
+    pred_roots = decode_outputs.decode_roots(np.argmax(predictions[0], axis=-1), idx_to_char)
+    accuracies = {'root': float(np.mean(pred_roots == np.asarray(gold_roots)))}
+    for idx, (output, gold) in enumerate(zip(predictions[1:], gold_features)):
+        gold_indices = encoders[idx].transform(gold)
+        accuracies[cnn_rnn_with_context.OUTPUT_NAMES[idx + 1]] = float(np.mean(np.argmax(output, axis=-1) ==
+                                                                             gold_indices))
+    return accuracies
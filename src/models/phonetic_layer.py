@@ -0,0 +1,30 @@
+import numpy as np
+from keras import backend as K
+from keras.engine.topology import Layer
+
+
+class PhoneticFeatureLookup(Layer):
+    """Computes one tag head's phonetic features inside the graph from the current word's char indices.
+
+    Each index is looked up in a fixed (vocab_len, head_dim) table, then count features are summed and boolean ones
+    max-reduced over the character axis. The layer has no weights, so a model using it loads the weights of a model
+    fed with precomputed phonetic inputs. Chars mapped to the unknown index lose their features.
+    """
+    def __init__(self, char_table, count_mask, **kwargs):
+        super().__init__(**kwargs)
+        self.char_table = np.asarray(char_table, dtype='float32')
+        self.count_mask = np.asarray(count_mask, dtype='float32')
+
+    def call(self, inputs):
+        char_features = K.gather(K.constant(self.char_table), K.cast(inputs, 'int32'))
+        count_mask = K.constant(self.count_mask)
+        return count_mask * K.sum(char_features, axis=1) + (1 - count_mask) * K.max(char_features, axis=1)
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], self.char_table.shape[1])
+
+    def get_config(self):
+        config = {'char_table': self.char_table.tolist(), 'count_mask': self.count_mask.tolist()}
+        base_config = super().get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
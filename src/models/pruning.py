@@ -0,0 +1,165 @@
+import json
+import os
+
+import numpy as np
+from keras.models import Model
+
+from src.models import cnn_rnn_with_context, compiled_inference
+
+ARCHITECTURE_KEYS = ['num_filters', 'filter_len', 'rnn_output_size', 'dense_units', 'attention_units']
+
+
+def get_architecture_path(weights_path):
+    return os.path.splitext(weights_path)[0] + '.arch.json'
+
+
+def read_architecture(weights_path):
+    """The MorphAnalyzerModels kwargs saved next to pruned weights; empty for weights of the default architecture."""
+    architecture_path = get_architecture_path(weights_path)
+    if not os.path.exists(architecture_path):
+        return dict()
+    with open(architecture_path, 'r', encoding='utf-8') as f:
+        architecture = json.load(f)
+    return architecture
+
+
+def write_architecture(weights_path, architecture):
+    with open(get_architecture_path(weights_path), 'w', encoding='utf-8') as f:
+        json.dump(architecture, f, indent=2)
+
+
+def get_pruned_weights_path(weights_path, sparsity):
+    root, ext = os.path.splitext(weights_path)
+    return root + '_pruned' + str(int(round(100 * sparsity))) + ext
+
+
+def get_conv_layers(model):
+    """Conv1D branches in the order their pooled outputs are concatenated into `main_merge`."""
+    conv_layers = [layer for layer in model.layers if layer.name.startswith('Conv')]
+    return sorted(conv_layers, key=lambda layer: (layer.kernel_size[0], int(layer.name.split('_')[1])))
+
+
+def get_dense_layers(model):
+    return [layer for layer in model.layers if layer.name.startswith('dense_phonetic_') or
+            layer.name.startswith('dense1_')]
+
+
+def get_magnitude_scores(layers):
+    """L1 norm of each output unit's incoming weights (output units are on the kernel's last axis)."""
+    scores = dict()
+    for layer in layers:
+        kernel = layer.get_weights()[0]
+        scores[layer.name] = np.abs(kernel).reshape(-1, kernel.shape[-1]).sum(axis=0)
+    return scores
+
+
+def get_activation_scores(model, layers, calibration_inputs, batch_size=128):
+    """Mean absolute activation of each output unit over a calibration set."""
+    activations = Model(inputs=model.inputs, outputs=[layer.output for layer in layers]).predict(
+        calibration_inputs, batch_size=batch_size)
+    activations = activations if isinstance(activations, list) else [activations]
+    return {layer.name: np.abs(activation).reshape(-1, activation.shape[-1]).mean(axis=0)
+            for layer, activation in zip(layers, activations)}
+
+
+def get_kept_units(scores, num_kept):
+    return {name: np.sort(np.argsort(-layer_scores, kind='stable')[:num_kept]) for name, layer_scores in scores.items()}
+
+
+def get_gru_input_rows(conv_layers, kept_filters, num_filters):
+    """Rows of `gru_1`'s kernels to keep: branch b's channels in `main_merge` are its max-pooled filters at
+    b*2F + f followed by its average-pooled ones at b*2F + F + f."""
+    rows = list()
+    for branch, layer in enumerate(conv_layers):
+        kept = kept_filters[layer.name]
+        rows += [branch*2*num_filters + kept, branch*2*num_filters + num_filters + kept]
+    return np.concatenate(rows)
+
+
+def get_upstream_dense(layer_name, layer_names):
+    """Name of the pruned dense layer feeding `layer_name`, if any."""
+    if layer_name.startswith('dense1_'):
+        candidate = 'dense_phonetic_' + layer_name[len('dense1_'):]
+    elif layer_name.startswith('output'):
+        idx = layer_name[len('output'):]
+        candidate = 'dense1_' + idx if 'dense1_' + idx in layer_names else 'dense1_0'
+    else:
+        return None
+    return candidate if candidate in layer_names else None
+
+
+def slice_weights(layer, weights, kept_filters, kept_units, gru_rows, layer_names):
+    name = layer.name
+    if name in kept_filters:
+        return [weights[0][:, :, kept_filters[name]], weights[1][kept_filters[name]]]
+    if name == 'gru_1':
+        # forward and backward [kernel, recurrent_kernel, bias]; only the kernels see the conv channels
+        return [weight[gru_rows] if idx % 3 == 0 else weight for idx, weight in enumerate(weights)]
+    if name in kept_units or name.startswith('output'):
+        kernel, bias = weights
+        upstream = get_upstream_dense(name, layer_names)
+        if upstream is not None:
+            kernel = kernel[kept_units[upstream]]
+        if name in kept_units:
+            kernel, bias = kernel[:, kept_units[name]], bias[kept_units[name]]
+        return [kernel, bias]
+    return weights
+
+
+def prune_model(model, model_kwargs, sparsity, criterion='l1', calibration_inputs=None, batch_size=128):
+    """Physically removes the lowest-ranked `sparsity` fraction of filters in every conv branch and of units in every
+    `dense_phonetic_*`/`dense1_*` layer, and returns a compiled smaller model with the surviving weights.
+
+    Every branch (and every dense layer) keeps the same number of units so the pruned model is still a
+    MorphAnalyzerModels with a smaller `num_filters`/`dense_units`; the root decoder's sizes are left unchanged.
+    """
+    num_filters = model_kwargs.get('num_filters', 64)
+    dense_units = model_kwargs.get('dense_units') or num_filters*2
+    conv_layers, dense_layers = get_conv_layers(model), get_dense_layers(model)
+    if criterion == 'activation':
+        scores = get_activation_scores(model, conv_layers + dense_layers, calibration_inputs, batch_size=batch_size)
+    else:
+        scores = get_magnitude_scores(conv_layers + dense_layers)
+    num_kept_filters = max(1, int(round(num_filters * (1 - sparsity))))
+    num_kept_units = max(1, int(round(dense_units * (1 - sparsity))))
+    kept_filters = get_kept_units({layer.name: scores[layer.name] for layer in conv_layers}, num_kept_filters)
+    kept_units = get_kept_units({layer.name: scores[layer.name] for layer in dense_layers}, num_kept_units)
+    gru_rows = get_gru_input_rows(conv_layers, kept_filters, num_filters)
+
+    pruned_kwargs = dict(model_kwargs, num_filters=num_kept_filters, dense_units=num_kept_units,
+                         attention_units=model_kwargs.get('attention_units') or num_filters)
+    pruned_model = cnn_rnn_with_context.MorphAnalyzerModels(**pruned_kwargs).create_and_compile_model(freezer=False)
+    layer_names = set(layer.name for layer in model.layers)
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if len(weights) > 0:
+            pruned_model.get_layer(layer.name).set_weights(slice_weights(layer, weights, kept_filters, kept_units,
+                                                                         gru_rows, layer_names))
+    architecture = {key: pruned_kwargs[key] for key in ARCHITECTURE_KEYS if key in pruned_kwargs}
+    return pruned_model, architecture
+
+
+def get_output_accuracies(predictions, outputs):
+    """Root exact-match accuracy over one-hot sequences, and per-tag accuracy, keyed by OUTPUT_NAMES."""
+    accuracies = {'root': float(np.mean(np.all(np.argmax(predictions[0], axis=-1) ==
+                                               np.argmax(outputs[0], axis=-1), axis=-1)))}
+    for name, prediction, output in zip(cnn_rnn_with_context.OUTPUT_NAMES[1:], predictions[1:], outputs[1:]):
+        accuracies[name] = float(np.mean(np.argmax(prediction, axis=-1) == np.argmax(output, axis=-1)))
+    return accuracies
+
+
+def evaluate_model(model, val_inputs, val_outputs, timing_inputs, batch_size=128):
+    stats = compiled_inference.time_predictions(lambda x: model.predict(x, batch_size=batch_size), timing_inputs,
+                                                batch_size)
+    result = {'params': model.count_params(), 'words_per_second': stats['words_per_second']}
+    result.update(get_output_accuracies(model.predict(val_inputs, batch_size=batch_size), val_outputs))
+    return result
+
+
+def write_report(results, output_path):
+    columns = ['sparsity', 'num_filters', 'dense_units', 'params', 'words_per_second', 'speedup'] + \
+        cnn_rnn_with_context.OUTPUT_NAMES
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(columns) + '\n')
+        for result in results:
+            f.write('\t'.join(str(result[column]) for column in columns) + '\n')
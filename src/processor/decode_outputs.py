@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+
+OUTPUT_FORMATS = ['tsv', 'jsonl', 'npz']
+WRITE_CHUNK_SIZE = 10000
+
+
+def get_char_table(idx_to_char):
+    table = np.array([ord(char) for char in idx_to_char], dtype=np.uint32)
+    table[0] = 0 # index 0 is the start/padding token and is never written out
+    return table
+
+
+def decode_roots(char_indices, idx_to_char):
+    """Turns a (words, max_word_len) array of char indices into an array of root strings in one pass.
+
+    Indices are looked up as code points and each row is viewed as one fixed-width numpy unicode string, which
+    drops the trailing padding. Padding inside a word is first moved to the end of its row.
+    """
+    codes = get_char_table(idx_to_char)[np.asarray(char_indices)]
+    if np.any((codes[:, :-1] == 0) & (codes[:, 1:] != 0)):
+        order = np.argsort(codes == 0, axis=1, kind='stable')
+        codes = np.take_along_axis(codes, order, axis=1)
+    codes = np.ascontiguousarray(codes)
+    return codes.view('<U' + str(codes.shape[1])).ravel()
+
+
+def decode_feature(feature_indices, encoder):
+    return encoder.classes_[np.asarray(feature_indices)]
+
+
+def decode_features(feature_indices, encoders):
+    return [decode_feature(each, encoders[i]) for i, each in enumerate(feature_indices)]
+
+
+def pad_and_stack(arrays):
+    max_len = max(each.shape[1] for each in arrays)
+    return np.concatenate([np.pad(each, ((0, 0), (0, max_len - each.shape[1])), mode='constant') for each in arrays])
+
+
+def write_tsv(output_path, columns, sentence_lengths=None):
+    names = [name for name, _ in columns]
+    rows = ['\t\t'.join(str(value) for value in row) + '\n' for row in zip(*[values for _, values in columns])]
+    if sentence_lengths is not None:
+        sentence_ends = set(np.cumsum(sentence_lengths) - 1)
+        rows = [row + '\n' if idx in sentence_ends else row for idx, row in enumerate(rows)]
+    with open(output_path + '.txt', 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.write('\t\t'.join(names) + '\n')
+        for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+            f.write(''.join(rows[start:start + WRITE_CHUNK_SIZE]))
+
+
+def write_jsonl(output_path, columns, sentence_lengths=None):
+    names = [name for name, _ in columns]
+    values = [[str(value) for value in values] for _, values in columns]
+    if sentence_lengths is not None:
+        names.append('sentence')
+        values.append(np.repeat(np.arange(len(sentence_lengths)), sentence_lengths).tolist())
+    rows = [json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in zip(*values)]
+    with open(output_path + '.jsonl', 'w', encoding='utf-8', buffering=1 << 20) as f:
+        for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+            f.write(''.join(rows[start:start + WRITE_CHUNK_SIZE]))
+
+
+def write_npz(output_path, columns, sentence_lengths=None):
+    arrays = {name: np.asarray(values).astype(str) for name, values in columns}
+    if sentence_lengths is not None:
+        arrays['sentence_lengths'] = np.asarray(sentence_lengths, dtype=np.int32)
+    np.savez_compressed(output_path + '.npz', **arrays)
+
+
+def write_table(output_path, columns, output_format='tsv', sentence_lengths=None):
+    """Writes equally long `columns` ([(name, values), ...]) to `output_path` plus the format's extension."""
+    writers = {'tsv': write_tsv, 'jsonl': write_jsonl, 'npz': write_npz}
+    writers[output_format](output_path, columns, sentence_lengths=sentence_lengths)
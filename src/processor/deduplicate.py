@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+from keras import optimizers
+from keras.callbacks import Callback
+from keras.models import clone_model
+
+
+def get_row_ids(array):
+    """Dense ids of the distinct rows of `array`, compared byte for byte over everything but the first axis."""
+    rows = np.ascontiguousarray(array).reshape(array.shape[0], -1)
+    rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    return np.unique(rows, return_inverse=True)[1]
+
+
+def get_example_codes(arrays):
+    """One id per example such that two examples share it iff they are equal in every array."""
+    codes = np.zeros(arrays[0].shape[0], dtype=np.int64)
+    for array in arrays:
+        pairs = np.stack([codes, get_row_ids(array)], axis=1)
+        codes = np.unique(pairs, axis=0, return_inverse=True)[1].ravel()
+    return codes
+
+
+def deduplicate(inputs, outputs):
+    """Keeps the first occurrence of every distinct (inputs, outputs) example and weights it by its count.
+
+    One-hot outputs are compared through their argmax. Weights are scaled to a mean of 1 so that a batch's weighted
+    mean loss matches the unweighted loss over the full data in expectation; returns (inputs, outputs, sample
+    weights, stats).
+    """
+    codes = get_example_codes(list(inputs) + [np.argmax(output, axis=-1) for output in outputs])
+    _, first_indices, counts = np.unique(codes, return_index=True, return_counts=True)
+    order = np.argsort(first_indices)
+    kept, counts = first_indices[order], counts[order]
+    sample_weights = (counts / counts.mean()).astype('float32')
+    stats = {'examples': int(codes.shape[0]), 'unique_examples': int(kept.shape[0]),
+             'dedup_ratio': float(kept.shape[0] / codes.shape[0]), 'max_count': int(counts.max())}
+    return [np.asarray(each[kept]) for each in inputs], [np.asarray(each[kept]) for each in outputs], sample_weights, \
+        stats
+
+
+class EpochTimer(Callback):
+    """Seconds spent on training batches per epoch, leaving out validation."""
+    def __init__(self):
+        super().__init__()
+        self.epoch_seconds = list()
+        self.start, self.last_batch_end = None, None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_batch_end(self, batch, logs=None):
+        self.last_batch_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_seconds.append(self.last_batch_end - self.start)
+
+
+def copy_for_timing(model):
+    """A copy of the compiled `model`, with the same optimizer settings, that can be trained without changing it."""
+    copy = clone_model(model)
+    copy.compile(optimizer=optimizers.deserialize({'class_name': type(model.optimizer).__name__,
+                                                   'config': model.optimizer.get_config()}),
+                 loss=model.loss, metrics=model.metrics, loss_weights=model.loss_weights)
+    return copy
+
+
+def time_batches(model, inputs, outputs, batch_size, num_batches, sample_weight=None):
+    """Seconds per training batch over `num_batches` consecutive batches of `inputs`, after one warm-up batch."""
+    total_batches = int(np.ceil(inputs[0].shape[0] / batch_size))
+
+    def train_batch(idx):
+        batch = slice((idx % total_batches) * batch_size, (idx % total_batches + 1) * batch_size)
+        model.train_on_batch([np.asarray(each[batch]) for each in inputs],
+                             [np.asarray(each[batch]) for each in outputs],
+                             sample_weight=[each[batch] for each in sample_weight] if sample_weight is not None
+                             else None)
+
+    train_batch(0)
+    start = time.perf_counter()
+    for idx in range(1, num_batches + 1):
+        train_batch(idx)
+    return (time.perf_counter() - start) / num_batches
+
+
+def time_epochs(model, full_data, dedup_data, batch_size, num_batches=50):
+    """Epoch times over every example and over the deduplicated ones, each timed on the same number of batches.
+
+    `full_data` is (inputs, outputs) and `dedup_data` (inputs, outputs, sample weights). Both run on one copy of
+    `model`, so its weights and optimizer state are left alone and no epoch is trained only to be measured.
+    """
+    copy = copy_for_timing(model)
+    num_examples, seconds_per_batch = list(), list()
+    for data in [full_data, dedup_data]:
+        num_examples.append(data[0][0].shape[0])
+        seconds_per_batch.append(time_batches(copy, data[0], data[1], batch_size, num_batches,
+                                              sample_weight=data[2] if len(data) > 2 else None))
+    full_epoch_seconds, dedup_epoch_seconds = [each * int(np.ceil(num / batch_size))
+                                               for each, num in zip(seconds_per_batch, num_examples)]
+    return {'full_epoch_seconds': full_epoch_seconds, 'dedup_epoch_seconds': dedup_epoch_seconds,
+            'epoch_time_reduction': float(1 - dedup_epoch_seconds / full_epoch_seconds)}
@@ -1,7 +1,43 @@
 import os
 import re
-from copy import deepcopy
+from functools import partial
+from multiprocessing import get_context
+
 from src import get_dataset_stats
+from src.processor import normalize_text
+
+
+def iter_sentences(lines):
+    words, roots, features = [], [], []
+    for line in lines:
+        line = line.strip()
+        if len(line) > 0:    # keep adding words till blank line
+            entities = re.split(r'\t+', line.rstrip('\t'))
+            words.append(entities[1])
+            roots.append(entities[2])
+            features.append(entities[5])
+        else:   # on encountering a blank line, all previous words form a sentence
+            yield words, roots, features
+            words, roots, features = [], [], []
+
+
+def segregate_token_features(feature, n_features):
+    values = [re.sub(r'.*-', '', i) for i in feature.split('|')[:n_features+1]]
+    values = [val if len(val) > 0 else 'UNK' for val in values]
+    if len(values) > 5:
+        del values[5]
+    return tuple(values)
+
+
+def list_data_files(path, lang='hindi'):
+    filepaths = list()
+    for item in os.listdir(path):
+        if lang == 'hindi':
+            filepaths.append(os.path.join(path, item))
+        elif lang == 'urdu':
+            filepaths += [os.path.join(*[path, item, file]) for file in os.listdir(os.path.join(path, item))]
+    return filepaths
+
 
 class ParseFile():
     def __init__(self, path):
@@ -19,34 +55,18 @@ class ParseFile():
 
 
     def get_content_from_all_lines(self, lines):
-        words, roots, features = [], [], []
-        for line in lines:
-            line = line.strip()
-            if len(line) > 0:    # keep adding words till blank line
-                entities = re.split(r'\t+', line.rstrip('\t'))
-                words.insert(len(words), entities[1])
-                roots.insert(len(roots), entities[2])
-                features.insert(len(features), entities[5])
-                continue
-            else:   # on encountering a blank line, add all previous words to form a sentence
-                _words, _roots, _features = [deepcopy(each) for each in [words, roots, features]]
-                self.sentences_with_words.append(_words)
-                self.sentences_with_roots.append(_roots)
-                self.sentences_with_features.append(_features)
-                words.clear()
-                roots.clear()
-                features.clear()
+        for words, roots, features in iter_sentences(lines):
+            self.sentences_with_words.append(words)
+            self.sentences_with_roots.append(roots)
+            self.sentences_with_features.append(features)
 
 
     def flatten_and_segregate_features(self, n_features):
         flat_features = [item for sublist in self.sentences_with_features for item in sublist]
-        splitted_features = [feature.split('|') for feature in flat_features]
-        all_features = [[], [], [], [], [], [], []]
-        for feature in splitted_features:
-            for idx, (i,j) in enumerate(zip(feature[:n_features+1], all_features[:n_features+1])):
-                val = re.sub(r'.*-', '', i)
-                _ = [j.append(val) if len(val) > 0 else j.append('UNK')]
-        del all_features[5]
+        all_features = [[] for _ in range(n_features)]
+        for feature in flat_features:
+            for val, j in zip(segregate_token_features(feature, n_features), all_features):
+                j.append(val)
         return all_features
 
     def get_stats_for_data(self, indiv_features):
@@ -61,17 +81,9 @@ class ParseFile():
 
 
     def read_dir(self, lang='hindi'):
-        cnt = 0
-        for item in os.listdir(self.path):
-            if lang == 'hindi':
-                filepath = os.path.join(self.path, item)
-                lines = self.read_file(filepath)
-                self.get_content_from_all_lines(lines)
-            elif lang == 'urdu':
-                for file in os.listdir(os.path.join(self.path, item)):
-                    filepath = os.path.join(*[self.path, item, file])
-                    lines = self.read_file(filepath)
-                    self.get_content_from_all_lines(lines)
+        for filepath in list_data_files(self.path, lang=lang):
+            lines = self.read_file(filepath)
+            self.get_content_from_all_lines(lines)
         return self.sentences_with_words, self.sentences_with_roots, self.sentences_with_features
 
 
@@ -91,8 +103,34 @@ def get_words_roots_and_features(path, n_features, lang='hindi', get_stats=False
         exit(1)
     return all_words, all_roots, indiv_features
 
-def get_words_for_predictions(data_dir):
-    sentences = [line.split() for line in open(data_dir, 'r', encoding='utf-8').readlines()]
+def get_file_stats(filepath, n_features, approximate=False):
+    stats = get_dataset_stats.StreamingStats(n_tags=n_features, approximate=approximate)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for words, _, features in iter_sentences(f):
+            stats.update(words, [segregate_token_features(feature, n_features) for feature in features])
+    return stats
+
+
+def get_streaming_stats(path, n_features, lang='hindi', workers=1, approximate=False):
+    """Computes corpus statistics file by file, merging the per-file accumulators from a process pool."""
+    filepaths = list_data_files(path, lang=lang)
+    stats = get_dataset_stats.StreamingStats(n_tags=n_features, approximate=approximate)
+    file_stats_getter = partial(get_file_stats, n_features=n_features, approximate=approximate)
+    if workers > 1:
+        with get_context('spawn').Pool(processes=workers) as pool:
+            for file_stats in pool.imap_unordered(file_stats_getter, filepaths):
+                stats.merge(file_stats)
+    else:
+        for filepath in filepaths:
+            stats.merge(file_stats_getter(filepath))
+    return stats.to_dict()
+
+
+def get_words_for_predictions(data_dir, vocab=None, workers=1, min_pool_lines=20000):
+    """One list of normalized words and punctuation per input line (see `normalize_text.tokenize`)."""
+    with open(data_dir, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    sentences = normalize_text.tokenize(lines, vocab=vocab, workers=workers, min_pool_lines=min_pool_lines)
     return sentences
 
 if __name__ == "__main__":
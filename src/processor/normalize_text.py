@@ -0,0 +1,107 @@
+import re
+import time
+import unicodedata
+from functools import lru_cache, partial
+from multiprocessing import get_all_start_methods, get_context
+
+# zero width space, zero width joiner, word joiner and BOM carry no letter; ZWNJ is kept as it separates Urdu words
+JOINERS = '\u200b\u200d\u2060\ufeff'
+JOINER_TABLE = str.maketrans('', '', JOINERS)
+# ASCII punctuation, danda and double danda, Urdu full stop, comma, semicolon and question mark, curly quotes, ellipsis
+PUNCTUATION = r'!-/:-@\[-`{-~\u0964\u0965\u06d4\u060c\u061b\u061f\u2018-\u201f\u2026'
+# words keep '.', '-', ':' and '/' between their letters or digits (3.5, 10:30, धीरे-धीरे); a trailing '.' is only kept
+# on abbreviations, dotted short parts (U.S., ई.पू.) or a single letter (initials), unless it ends the line. Any
+# other punctuation, a full stop after a word included, is a token of its own
+WORD = r'[^\s' + PUNCTUATION + r']+'
+SHORT_PART = r'[^\s' + PUNCTUATION + r']{1,3}'
+ABBREVIATION = r'(?:' + SHORT_PART + r'(?:\.' + SHORT_PART + r')+|[^\s' + PUNCTUATION + r'])\.(?=[\s' + PUNCTUATION + \
+    r'])(?!\s*$)'
+TOKEN_PATTERN = re.compile(ABBREVIATION + r'|' + WORD + r'(?:[.\-:/]' + WORD + r')*|[' + PUNCTUATION + r']')
+# NFC leaves these Devanagari letters decomposed (they are composition exclusions)
+NUKTA_COMPOSITIONS = {'\u0915\u093c': '\u0958', '\u0916\u093c': '\u0959', '\u0917\u093c': '\u095a',
+                      '\u091c\u093c': '\u095b', '\u0921\u093c': '\u095c', '\u0922\u093c': '\u095d',
+                      '\u092b\u093c': '\u095e', '\u092f\u093c': '\u095f'}
+NUKTA_PATTERN = re.compile('|'.join(NUKTA_COMPOSITIONS))
+CACHE_SIZE = 2**16
+
+
+def get_spellings(token):
+    """Equivalent spellings of a token without joiners, most canonical first: NFC, NFC with nukta letters composed,
+    NFD and the token as written."""
+    token = token.translate(JOINER_TABLE)
+    nfc = unicodedata.normalize('NFC', token)
+    return [nfc, NUKTA_PATTERN.sub(lambda match: NUKTA_COMPOSITIONS[match.group(0)], nfc),
+            unicodedata.normalize('NFD', token), token]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_token(token, vocab=None):
+    """The spelling of `token` with the fewest characters outside `vocab` (a frozenset of the trained characters),
+    NFC on ties or without a vocab, so no composition turns known characters into unknown ones."""
+    spellings = get_spellings(token)
+    if vocab is None:
+        return spellings[0]
+    return min(spellings, key=lambda spelling: sum(char not in vocab for char in spelling))
+
+
+def tokenize_lines(lines, vocab=None):
+    """Splits each line into words and punctuation with one regex pass, normalizing every token through the cache.
+
+    Tokens that were only joiners are dropped; each line gives one list, as `line.split()` would.
+    """
+    findall, normalize = TOKEN_PATTERN.findall, normalize_token
+    sentences = list()
+    for line in lines:
+        tokens = [normalize(token, vocab) for token in findall(line)]
+        sentences.append([token for token in tokens if len(token) > 0])
+    return sentences
+
+
+def tokenize(lines, vocab=None, workers=1, min_pool_lines=20000):
+    """`tokenize_lines`, split over a pool of `workers` processes once there are at least `min_pool_lines`.
+
+    The workers are forked, so they start with this process's modules and token cache instead of a fresh interpreter
+    re-importing the model code, and each gets one contiguous part of the lines. Without fork it runs serially.
+    """
+    if workers <= 1 or len(lines) < min_pool_lines or 'fork' not in get_all_start_methods():
+        return tokenize_lines(lines, vocab=vocab)
+    part_size = -(-len(lines) // workers)
+    parts = [lines[start:start + part_size] for start in range(0, len(lines), part_size)]
+    sentences = list()
+    with get_context('fork').Pool(processes=len(parts)) as pool:
+        for part_sentences in pool.imap(partial(tokenize_lines, vocab=vocab), parts):
+            sentences += part_sentences
+    return sentences
+
+
+def get_oov_rate(sentences, vocab):
+    chars = [char for sentence in sentences for token in sentence for char in token]
+    return sum(char not in vocab for char in chars) / max(len(chars), 1)
+
+
+def benchmark(lines, vocab=None, workers=1, repeats=3):
+    """Best-of-`repeats` lines/sec and tokens/sec of `line.split()`, the serial front-end from a cold cache and the
+    front-end on `workers` processes, with the cache hit rate of the serial run and, given a vocab, the character
+    OOV rate of both tokenizations."""
+    runs = {'split': lambda: [line.split() for line in lines],
+            'serial': lambda: tokenize_lines(lines, vocab=vocab)}
+    if workers > 1:
+        runs['pool'] = lambda: tokenize(lines, vocab=vocab, workers=workers, min_pool_lines=0)
+    results, outputs = dict(), dict()
+    for name, run in runs.items():
+        seconds = list()
+        for _ in range(repeats):
+            normalize_token.cache_clear()
+            start = time.perf_counter()
+            outputs[name] = run()
+            seconds.append(time.perf_counter() - start)
+            if name == 'serial':
+                cache_info = normalize_token.cache_info()
+        num_tokens = sum(len(sentence) for sentence in outputs[name])
+        results[name] = {'seconds': min(seconds), 'lines_per_second': len(lines) / min(seconds),
+                         'tokens_per_second': num_tokens / min(seconds), 'tokens': num_tokens}
+    results['serial']['cache_hit_rate'] = cache_info.hits / max(cache_info.hits + cache_info.misses, 1)
+    if vocab is not None:
+        for name in ['split', 'serial']:
+            results[name]['char_oov_rate'] = get_oov_rate(outputs[name], vocab)
+    return results
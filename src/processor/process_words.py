@@ -1,12 +1,18 @@
-from collections import deque
+import hashlib
+import json
+import os
+from collections import Counter, deque
+from multiprocessing import get_context
 
 import numpy as np
-from nltk import FreqDist
+from keras.preprocessing.sequence import pad_sequences
 
 from src import handle_pickles
+from src.processor import extract_word_root_and_feature
 
 pickle_handler = handle_pickles.PickleHandler()
-x_char2idx = dict()
+x_char2idx = dict() # lang -> char to index mapping
+x_idx2char = dict() # lang -> index to char mapping
 
 class ShiftWordsPerCW():
     def __init__(self, X, vocab_size, cw=4, lang='hindi'):
@@ -43,12 +49,75 @@ class ShiftWordsPerCW():
         return X_left, X_right
 
 
+def sequence_padder(in_list, maxlen):
+    out_list = pad_sequences(in_list, maxlen=maxlen, dtype='int32', padding='post')
+    return out_list
+
+
+def pad_all_sequences(indexed_outputs):
+    max_word_len = max(max([len(word) for word in indexed_outputs[0]]), max([len(word) for word in indexed_outputs[-1]]))
+    all_padded_inputs = [sequence_padder(each, max_word_len) for each in indexed_outputs]
+    return all_padded_inputs, max_word_len
+
+
+def get_decoder_input(x_train):
+    x_decoder_input = np.zeros_like(x_train)
+    x_decoder_input[:, 1:] = x_train[:, :-1]
+    x_decoder_input[:, 0] = 1
+    return x_decoder_input
+
+
 def filter_unicodes(vocab_list):
     unicode_list = ['\u200d', '\u200b']
     _vocab_list = [each for each in vocab_list if each[0] not in unicode_list]
     return _vocab_list
 
 
+def count_characters(words):
+    char_counts = Counter()
+    for word in words:
+        char_counts.update(word)
+    return char_counts
+
+
+def count_characters_in_file(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        char_counts = count_characters(word[::-1] for words, _, _ in extract_word_root_and_feature.iter_sentences(f)
+                                       for word in words)
+    return char_counts
+
+
+def save_vocab(char_counts, vocab_size, lang='hindi'):
+    """Keeps the `vocab_size` most frequent chars (ties in order of first occurrence, as `FreqDist` does)."""
+    x_vocab = filter_unicodes(char_counts.most_common(vocab_size))
+    x_idx2char = [each[0] for each in x_vocab]
+    x_idx2char.insert(0, 'Z') # starting token
+    x_idx2char.append('U') # OOV chars
+    pickle_handler.pickle_dumper(x_idx2char, 'index_to_char_mapping'+'_'+lang)
+    manifest = {'version': hashlib.sha1('\n'.join(x_idx2char).encode('utf-8')).hexdigest(),
+                'vocab_size': vocab_size, 'num_indices': len(x_idx2char), 'total_chars': sum(char_counts.values()),
+                'char_counts': {char: char_counts[char] for char in x_idx2char[1:-1]}}
+    with open(os.path.join(pickle_handler.get_resource_dir(), 'vocab_manifest_'+lang+'.json'), 'w',
+              encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return x_idx2char
+
+
+def build_vocab_from_files(data_dirs, vocab_size, lang='hindi', workers=1):
+    """Counts the chars of every (reversed) word one file at a time and merges the counts in corpus order."""
+    filepaths = [filepath for data_dir in data_dirs
+                 for filepath in extract_word_root_and_feature.list_data_files(data_dir, lang=lang)]
+    char_counts = Counter()
+    if workers > 1:
+        with get_context('spawn').Pool(processes=workers) as pool:
+            for file_char_counts in pool.imap(count_characters_in_file, filepaths):
+                char_counts.update(file_char_counts)
+    else:
+        for filepath in filepaths:
+            char_counts.update(count_characters_in_file(filepath))
+    return save_vocab(char_counts, vocab_size, lang=lang)
+
+
 def one_hot_encode_output_data(sequences, max_word_len, vocab_size):
     _sequences = np.zeros((len(sequences), max_word_len, vocab_size))
     for i, word in enumerate(sequences):
@@ -57,22 +126,26 @@ def one_hot_encode_output_data(sequences, max_word_len, vocab_size):
     return _sequences
 
 
+def set_vocab(idx2char, lang='hindi'):
+    x_idx2char[lang] = idx2char
+    x_char2idx[lang] = {letter: idx for idx, letter in enumerate(idx2char)}
+
+
+def load_vocab(lang='hindi'):
+    """The saved index to char mapping of `lang`, loaded once per process and shared by everything that needs it."""
+    if lang not in x_idx2char:
+        set_vocab(pickle_handler.pickle_loader('index_to_char_mapping'+'_'+lang), lang=lang)
+    return x_idx2char[lang]
+
+
 def get_indexed_words(X, vocab_size, mode='build_vocab', lang='hindi'):
-    global x_char2idx
     X_char = [list(word) for word in X if len(word) > 0]
     if mode == 'build_vocab':
-        dist = FreqDist(np.hstack(X_char))
-        _x_vocab = dist.most_common(vocab_size)
-        x_vocab = filter_unicodes(_x_vocab)
-        x_idx2char = [each[0] for each in x_vocab]
-        x_idx2char.insert(0, 'Z') # starting token
-        x_idx2char.append('U') # OOV chars
-        pickle_handler.pickle_dumper(x_idx2char, 'index_to_char_mapping'+'_'+lang)
+        set_vocab(save_vocab(count_characters(X_char), vocab_size, lang=lang), lang=lang)
     elif mode == 'use_vocab':
-        x_idx2char = pickle_handler.pickle_loader('index_to_char_mapping'+'_'+lang)
-    if len(x_char2idx) == 0:
-        x_char2idx = {letter: idx for idx, letter in enumerate(x_idx2char)}
-    X = [[x_char2idx[char] if char in x_char2idx else x_char2idx['U'] for (j, char) in enumerate(word)]
+        load_vocab(lang=lang)
+    char2idx = x_char2idx[lang]
+    X = [[char2idx[char] if char in char2idx else char2idx['U'] for (j, char) in enumerate(word)]
                 for (i, word) in enumerate(X_char)]
     return X
 
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+
+
+def get_data_fingerprint(data_dirs):
+    digest = hashlib.sha1()
+    for data_dir in data_dirs:
+        for root, _, files in sorted(os.walk(data_dir)):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                digest.update((path + ':' + str(stat.st_size) + ':' + str(stat.st_mtime_ns)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class TensorStore():
+    """Model-ready input and output arrays saved as one `.npy` file each, plus a JSON manifest.
+
+    Arrays are opened with `mmap_mode='r'` so that later runs (and concurrent processes) read them straight from
+    the OS page cache instead of re-running the preprocessing. One-hot outputs are stored as uint8. Lists of strings
+    needed next to the arrays (e.g. the words and roots written with the predictions) go to `texts.json`.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+        self.texts_path = os.path.join(store_dir, 'texts.json')
+
+    def get_array_path(self, prefix, idx):
+        return os.path.join(self.store_dir, prefix + '_' + str(idx) + '.npy')
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest
+
+    def is_compatible(self, **expected):
+        if not self.exists() or None in expected.values():
+            return False
+        manifest = self.read_manifest()
+        return manifest.get('format_version') == STORE_FORMAT_VERSION and \
+            all(manifest.get(key) == value for key, value in expected.items())
+
+    def write(self, inputs, outputs, manifest, texts=None):
+        os.makedirs(self.store_dir, exist_ok=True)
+        if self.exists():
+            os.remove(self.manifest_path)
+        for idx, array in enumerate(inputs):
+            np.save(self.get_array_path('input', idx), np.asarray(array))
+        for idx, array in enumerate(outputs):
+            np.save(self.get_array_path('output', idx), np.asarray(array, dtype=np.uint8))
+        if texts is not None:
+            with open(self.texts_path, 'w', encoding='utf-8') as f:
+                json.dump(texts, f, ensure_ascii=False)
+        manifest = dict(manifest, format_version=STORE_FORMAT_VERSION, num_inputs=len(inputs),
+                        num_outputs=len(outputs), texts=sorted(texts) if texts is not None else list())
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def read(self, mmap_mode='r'):
+        manifest = self.read_manifest()
+        inputs, outputs = [[np.load(self.get_array_path(prefix, idx), mmap_mode=mmap_mode)
+                            for idx in range(manifest['num_' + prefix + 's'])] for prefix in ['input', 'output']]
+        return inputs, outputs, manifest
+
+    def read_texts(self):
+        with open(self.texts_path, 'r', encoding='utf-8') as f:
+            texts = json.load(f)
+        return texts
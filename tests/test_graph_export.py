@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip('keras')
+
+from src import handle_pickles
+from src.models import cnn_rnn_with_context, graph_export
+
+CONTEXT_WINDOW = 2
+VOCAB_LEN = 12
+FEATURE_NUMS = [3, 4, 2, 3, 5, 6]
+
+
+def get_model_builder(weights_path):
+    def model_builder(max_word_len):
+        model = cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=max_word_len, vocab_len=VOCAB_LEN,
+                                                         embedding_dim=8, list_of_feature_nums=FEATURE_NUMS,
+                                                         cw=CONTEXT_WINDOW, num_filters=4,
+                                                         rnn_output_size=4).cnn_rnn()
+        model.load_weights(weights_path)
+        return model
+    return model_builder
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(handle_pickles, 'RESOURCE_DIR', str(tmp_path / 'resources'))
+    (tmp_path / 'resources').mkdir()
+    handle_pickles.PickleHandler().pickle_dumper(['Z'] + list('abcdefghij') + ['U'], 'index_to_char_mapping_test')
+    weights_path = str(tmp_path / 'weights.hdf5')
+    cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=5, vocab_len=VOCAB_LEN, embedding_dim=8,
+                                             list_of_feature_nums=FEATURE_NUMS, cw=CONTEXT_WINDOW, num_filters=4,
+                                             rnn_output_size=4).cnn_rnn().save_weights(weights_path)
+    model_builder = get_model_builder(weights_path)
+    graph_export.export_variant(model_builder, str(tmp_path / 'export'), [3, 5], ['index_to_char_mapping_test'],
+                                ['index_to_char_mapping_test'], metadata={'variant': 'test'})
+    return str(tmp_path / 'export'), model_builder
+
+
+@pytest.mark.parametrize('word_len', [3, 5])
+def test_frozen_graph_matches_keras_predict(export_dir, word_len):
+    export_dir, model_builder = export_dir
+    _ = graph_export.check_export(model_builder, export_dir, word_len, vocab_len=VOCAB_LEN, batch_size=16)
+
+
+def test_unexported_length_is_rejected(export_dir):
+    export_dir, _ = export_dir
+    predictor = graph_export.FrozenGraphPredictor(export_dir, batch_size=16)
+    with pytest.raises(ValueError):
+        predictor.warm_up([4])
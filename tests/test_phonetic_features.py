@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from keras.layers import Input
+from keras.models import Model
+
+from src import extract_phonetic_features
+from src.models.phonetic_layer import PhoneticFeatureLookup
+
+WORDS = 'रेगिस्तान का मुसाफिर एक बूँद को प्यासा होता है |'.split(' ')
+IDX_TO_CHAR = ['Z'] + sorted(set(''.join(WORDS))) + ['U']
+# क़ (with nukta), ऋ, ष and ग्रं are not in the vocab above; Latin letters carry no phonetic features
+OOV_WORDS = ['क़िला', 'ऋषि', 'ग्रंथ', 'AB', 'कAम']
+
+
+def get_random_words(num_words=1000, max_len=12, seed=0):
+    """Random words over the vocab chars, leaving out the padding (index 0) and the 'U' index."""
+    chars = [char for char in IDX_TO_CHAR[1:] if char != 'U']
+    rng = np.random.RandomState(seed)
+    return [''.join(rng.choice(chars, size=rng.randint(1, max_len + 1))) for _ in range(num_words)]
+
+
+def get_char_indices(words):
+    """Reversed, post-padded char indices with OOV chars as 'U', as `process_words.get_indexed_words` builds them."""
+    char2idx = {char: idx for idx, char in enumerate(IDX_TO_CHAR)}
+    max_len = max(len(word) for word in words)
+    return np.array([[char2idx.get(char, char2idx['U']) for char in word[::-1]] + [0] * (max_len - len(word))
+                     for word in words])
+
+
+def get_expected_features(words):
+    """`PhoneticFeatures` of each word with its OOV chars removed, which is all a lookup from char indices can see."""
+    vocab = set(IDX_TO_CHAR)
+    words = [''.join(char for char in word if char in vocab) for word in words]
+    features = extract_phonetic_features.PhoneticFeatures(words).get_features()
+    return [each.astype('float32') for each in extract_phonetic_features.group_features_by_tag(features)]
+
+
+def get_table_features(char_indices):
+    """The lookup the layer does, in numpy: count features summed and boolean ones max-reduced over the chars."""
+    return [np.where(count_mask, table[char_indices].sum(axis=1), table[char_indices].max(axis=1))
+            for table, count_mask in extract_phonetic_features.get_char_feature_tables(IDX_TO_CHAR)]
+
+
+def assert_features_equal(words, expected, computed):
+    for head_idx, (head_expected, head_computed) in enumerate(zip(expected, computed)):
+        mismatches = np.flatnonzero(~np.isclose(head_expected, head_computed).all(axis=1))
+        assert len(mismatches) == 0, f"Head {head_idx}: features of {words[mismatches[0]]!r} differ"
+
+
+@pytest.mark.parametrize('words', [WORDS, get_random_words()], ids=['sentence', 'random'])
+def test_char_feature_tables_match_phonetic_features(words):
+    expected = extract_phonetic_features.group_features_by_tag(
+        extract_phonetic_features.PhoneticFeatures(words).get_features())
+    assert_features_equal(words, [each.astype('float32') for each in expected],
+                          get_table_features(get_char_indices(words)))
+
+
+def test_oov_chars_only_lose_their_own_features():
+    assert_features_equal(OOV_WORDS, get_expected_features(OOV_WORDS), get_table_features(get_char_indices(OOV_WORDS)))
+
+
+def test_dropped_feature_chars_are_counted():
+    dropped = extract_phonetic_features.count_dropped_feature_chars(OOV_WORDS, IDX_TO_CHAR)
+    assert dropped['ऋ'] == 1 and dropped['़'] == 1
+    assert 'A' not in dropped and 'B' not in dropped
+    assert len(extract_phonetic_features.count_dropped_feature_chars(WORDS, IDX_TO_CHAR)) == 0
+
+
+def test_lookup_layer_matches_phonetic_features():
+    words = WORDS + get_random_words(num_words=200) + OOV_WORDS
+    char_indices = get_char_indices(words).astype('float32')
+    word_input = Input(shape=(char_indices.shape[1],), dtype='float32')
+    tables = extract_phonetic_features.get_char_feature_tables(IDX_TO_CHAR)
+    model = Model(inputs=word_input, outputs=[PhoneticFeatureLookup(table, mask)(word_input) for table, mask in tables])
+    assert_features_equal(words, get_expected_features(words), model.predict(char_indices))
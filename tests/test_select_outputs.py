@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from src.models import cnn_rnn_with_context
+
+CONTEXT_WINDOW = 2
+MAX_WORD_LEN = 6
+VOCAB_LEN = 12
+FEATURE_NUMS = [3, 4, 2, 3, 5, 6]
+PHONETIC_DIMS = [2, 3, 2, 4, 2, 3]
+
+
+def build_model(use_phonetic_features):
+    return cnn_rnn_with_context.MorphAnalyzerModels(max_word_len=MAX_WORD_LEN, vocab_len=VOCAB_LEN, embedding_dim=8,
+                                                    list_of_feature_nums=FEATURE_NUMS, cw=CONTEXT_WINDOW,
+                                                    use_phonetic_features=use_phonetic_features,
+                                                    phonetic_dims=PHONETIC_DIMS, num_filters=4,
+                                                    rnn_output_size=4).cnn_rnn()
+
+
+def get_inputs(model, num_words=5, seed=0):
+    rng = np.random.RandomState(seed)
+    return [rng.randint(1, VOCAB_LEN, size=(num_words, MAX_WORD_LEN)).astype('float32') if name.startswith('input_')
+            else rng.randint(0, 3, size=(num_words,) + model.get_layer(name).output_shape[1:]).astype('float32')
+            for name in model.input_names]
+
+
+@pytest.mark.parametrize('use_phonetic_features', [False, True])
+@pytest.mark.parametrize('outputs', [['POS'], ['root'], ['root', 'case']])
+def test_select_outputs_matches_full_model(outputs, use_phonetic_features):
+    model = build_model(use_phonetic_features)
+    inputs = get_inputs(model)
+    expected = model.predict(inputs)
+    sub_model = cnn_rnn_with_context.select_outputs(model, outputs)
+    inputs_by_name = dict(zip(model.input_names, inputs))
+    computed = sub_model.predict([inputs_by_name[name] for name in sub_model.input_names])
+    computed = computed if isinstance(computed, list) else [computed]
+    assert len(computed) == len(outputs)
+    for output, output_values in zip(outputs, computed):
+        np.testing.assert_allclose(output_values, expected[cnn_rnn_with_context.OUTPUT_NAMES.index(output)],
+                                   atol=1e-6)
+
+
+def test_tag_heads_require_the_decoder_input():
+    model = build_model(use_phonetic_features=True)
+    required_names = cnn_rnn_with_context.get_required_input_names(model.input_names, ['POS'])
+    assert 'input_' + str(2*CONTEXT_WINDOW + 1) in required_names
+    assert 'phonetic_0' in required_names and 'phonetic_1' not in required_names